@@ -114,180 +114,371 @@
 
 
 # app.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-import requests
-from bs4 import BeautifulSoup
-from googlesearch import search
 import time
-import re
+import json
+import yaml
+
+from src.backends import load_backend
+from src.preprocessing import IMG_SIZE, decode_image, predict_tiled
+from serving.batching import MicroBatcher
+from serving.remedy_cache import RemedyCache
+from serving.remedy_fetcher import PageFetcher
+from serving.remedy_extractor import extract_remedy_from_html
+from serving.upload_store import UploadStore
+from serving.result_cache import ResultCache, content_hash
+from serving.batch_predict import BatchPredictor, close_uploads, iter_uploads, spool_uploads
+from serving.metrics import MetricsRegistry, RequestTimer
+from serving.model_loader import BackgroundModelLoader, backend_options, warmup_batch_sizes
+from serving.inference_pool import installed_client
 
 
 # Initialize Flask app
 app = Flask(__name__)
+CORS_ORIGINS = [
+    "https://crop-ai-frontend.onrender.com",  # Frontend URL
+    "http://localhost:3000",  # Local development
+    "*"  # Use cautiously, preferably specify exact origins
+]
 CORS(app, resources={
     r"/api/*": {
-        "origins": [
-            "https://crop-ai-frontend.onrender.com",  # Frontend URL
-            "http://localhost:3000",  # Local development
-            "*"  # Use cautiously, preferably specify exact origins
-        ]
+        "origins": CORS_ORIGINS
     }
 })  # Enable CORS for all routes
 app.config['UPLOAD_FOLDER'] = 'uploads'
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Load model and class names
-model = load_model('models/saved_models/crop_disease_model.keras')
-with open('models/saved_models/class_names.txt', 'r') as f:
+# Load serving configuration (CROP_APP_CONFIG points at an alternative file)
+with open(os.environ.get('CROP_APP_CONFIG', 'configs/config.yaml'), 'r') as f:
+    config = yaml.safe_load(f) or {}
+serving_config = config.get('serving', {})
+
+# Prometheus-style metrics and per-stage request timing
+metrics_config = serving_config.get('metrics', {})
+server_timing_enabled = metrics_config.get('server_timing', False)
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('crop_request_stage_seconds', 'Time spent in each stage of a prediction request',
+                                  labelnames=('endpoint', 'stage'))
+predictions_total = metrics.counter('crop_predictions_total', 'Predictions served by predicted class',
+                                    labelnames=('predicted_class',))
+remedy_fetch_seconds = metrics.histogram('crop_remedy_fetch_seconds', 'Duration of background remedy web lookups')
+
+# Batch sizes the model runs at (micro-batches and the batch endpoint)
+batching_config = serving_config.get('batching', {})
+batch_config = serving_config.get('batch_endpoint', {})
+max_batch_size = batching_config.get('max_batch_size', 32)
+endpoint_batch_size = batch_config.get('batch_size', 32)
+
+# Load model (Keras, TFLite or ONNX backend) in the background, warmed up at
+# every batch size above; the server answers /healthz straight away and
+# /readyz once the model is ready. Class names are cheap, load them now.
+model_config = serving_config.get('model', {})
+MODEL_PATH = model_config.get('path', 'models/saved_models/crop_disease_model.keras')
+CLASS_NAMES_PATH = 'models/saved_models/class_names.txt'
+
+def load_model():
+    # Under gunicorn.conf.py with an inference pool, batches go to the shared
+    # inference processes instead of a model copy in this process
+    pool_client = installed_client()
+    if pool_client is not None:
+        pool_client.wait_ready()
+        return pool_client
+    return load_backend(MODEL_PATH, backend=model_config.get('backend'), num_threads=model_config.get('num_threads'),
+                        **backend_options(serving_config))
+
+model = BackgroundModelLoader(load_model, warmup_batch_sizes=warmup_batch_sizes(serving_config))
+# The inference processes normalize themselves, so batches for them stay uint8
+# (a quarter of the bytes to pickle across the process boundary)
+pixel_inputs = installed_client() is not None
+with open(CLASS_NAMES_PATH, 'r') as f:
     class_names = [line.strip() for line in f.readlines()]
 
-# Function to fetch remedies
-def fetch_disease_remedy(disease_name):
-    try:
-        # Format the query to search for disease treatment
-        query = f"{disease_name} plant disease treatment remedy"
-        
-        # Search for relevant pages (limit to agricultural/gardening domains for better results)
-        search_results = list(search(query, num_results=5, lang="en"))
-        
-        # Filter for reliable agricultural domains if possible
-        reliable_domains = ['.edu', '.gov', 'extension.', 'gardening.', 'agriculture.']
-        filtered_results = [url for url in search_results if any(domain in url for domain in reliable_domains)]
-        
-        # Use filtered results if available, otherwise use original results
-        urls_to_check = filtered_results if filtered_results else search_results[:3]
-        
-        # Initialize remedy structure
-        remedy = {
-            "info": "",
-            "treatment": "",
-            "prevention": "",
-            "chemical_control": "",
-            "organic_control": ""
+# Batch concurrent requests into a single forward pass
+batcher = MicroBatcher(
+    model.predict,
+    max_batch_size=max_batch_size,
+    max_wait_ms=batching_config.get('max_wait_ms', 10),
+    pixel_inputs=pixel_inputs
+).start()
+
+# Cache predictions by upload content; dropped when the model file changes
+result_cache_config = serving_config.get('result_cache', {})
+result_cache = ResultCache(
+    max_bytes=result_cache_config.get('max_megabytes', 16) * 1024 * 1024,
+    watch_paths=[MODEL_PATH, CLASS_NAMES_PATH]
+)
+
+# Decode raw upload bytes into uint8 pixels (into out when given); the
+# batchers (or the inference processes) normalize whole batches with the
+# training scaling
+def load_upload_array(data, out=None):
+    return decode_image(data, target_size=IMG_SIZE, out=out)
+
+# Turn one prediction vector into the top class and top 3 predictions
+def summarize_predictions(predictions):
+    top_indices = predictions.argsort()[-3:][::-1]
+    top_predictions = [
+        {"class": class_names[i], "confidence": float(predictions[i])} 
+        for i in top_indices
+    ]
+    return {
+        "predicted_class": class_names[np.argmax(predictions)],
+        "confidence": float(predictions[np.argmax(predictions)]),
+        "top_predictions": top_predictions
+    }
+
+# Fixed-size batches for multi-image uploads
+batch_predictor = BatchPredictor(
+    model.predict,
+    load_upload_array,
+    summarize_predictions,
+    batch_size=endpoint_batch_size,
+    max_workers=batch_config.get('decode_workers', 4),
+    cache=result_cache,
+    pixel_inputs=pixel_inputs
+)
+
+# Large field photos can be predicted from overlapping model-sized tiles at
+# full resolution instead of one downscaled frame (tiled=true on /api/predict)
+tiling_config = serving_config.get('tiling', {})
+
+def is_tiled_request(value):
+    return str(value or '').lower() in ('1', 'true', 'yes', 'on')
+
+def predict_upload_tiled(data):
+    """
+    summarize_predictions of the tile-aggregated probabilities, plus a
+    "tiles" entry with the tile grid (offsets in the tiled image, which is
+    downscaled to tiling.max_side) and the tile heatmap of the top classes
+    """
+    result = predict_tiled(
+        model.predict,
+        data,
+        overlap=tiling_config.get('overlap', 0.25),
+        batch_size=endpoint_batch_size,
+        max_side=tiling_config.get('max_side', 4096),
+        aggregate=tiling_config.get('aggregate', 'mean'),
+        pixel_inputs=pixel_inputs
+    )
+    probabilities = result["probabilities"]
+    heatmap = result["heatmap"]
+    ys, xs = result["origins"]
+    prediction = summarize_predictions(probabilities)
+    prediction["tiles"] = {
+        "rows": int(heatmap.shape[0]),
+        "columns": int(heatmap.shape[1]),
+        "tile_size": [IMG_SIZE[1], IMG_SIZE[0]],
+        "image_size": list(result["image_size"]),
+        "y_offsets": [int(y) for y in ys],
+        "x_offsets": [int(x) for x in xs],
+        "heatmap": {
+            class_names[i]: np.round(heatmap[..., i], 4).tolist()
+            for i in probabilities.argsort()[-3:][::-1]
         }
-        
-        # Extract information from pages
-        for url in urls_to_check:
-            try:
-                response = requests.get(url, timeout=5)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Extract main content
-                content = soup.get_text()
-                
-                # Extract disease information
-                if not remedy["info"]:
-                    info_patterns = [
-                        re.compile(r'(?:[A-Z][^.!?]*' + re.escape(disease_name) + r'[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*symptoms[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*disease[^.!?]*\.)', re.IGNORECASE)
-                    ]
-                    for pattern in info_patterns:
-                        info_matches = pattern.findall(content)
-                        if info_matches:
-                            remedy["info"] = '. '.join(info_matches[:2])
-                            break
-                
-                # Extract treatment information
-                if not remedy["treatment"]:
-                    treatment_patterns = [
-                        re.compile(r'(?:[A-Z][^.!?]*treatment[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*control[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*manage[^.!?]*\.)', re.IGNORECASE)
-                    ]
-                    for pattern in treatment_patterns:
-                        treatment_matches = pattern.findall(content)
-                        if treatment_matches:
-                            remedy["treatment"] = '. '.join(treatment_matches[:3])
-                            break
-                
-                # Extract prevention information
-                if not remedy["prevention"]:
-                    prevention_patterns = [
-                        re.compile(r'(?:[A-Z][^.!?]*prevent[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*avoid[^.!?]*\.)', re.IGNORECASE)
-                    ]
-                    for pattern in prevention_patterns:
-                        prevention_matches = pattern.findall(content)
-                        if prevention_matches:
-                            remedy["prevention"] = '. '.join(prevention_matches[:3])
-                            break
-                
-                # Extract chemical control information
-                if not remedy["chemical_control"]:
-                    chemical_patterns = [
-                        re.compile(r'(?:[A-Z][^.!?]*fungicide[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*pesticide[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*chemical[^.!?]*control[^.!?]*\.)', re.IGNORECASE)
-                    ]
-                    for pattern in chemical_patterns:
-                        chemical_matches = pattern.findall(content)
-                        if chemical_matches:
-                            remedy["chemical_control"] = '. '.join(chemical_matches[:3])
-                            break
-                
-                # Extract organic control information
-                if not remedy["organic_control"]:
-                    organic_patterns = [
-                        re.compile(r'(?:[A-Z][^.!?]*organic[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*natural[^.!?]*\.)', re.IGNORECASE),
-                        re.compile(r'(?:[A-Z][^.!?]*non.?chemical[^.!?]*\.)', re.IGNORECASE)
-                    ]
-                    for pattern in organic_patterns:
-                        organic_matches = pattern.findall(content)
-                        if organic_matches:
-                            remedy["organic_control"] = '. '.join(organic_matches[:3])
-                            break
+    }
+    return prediction
+
+# Optionally keep the original uploads (and a thumbnail), stored once per
+# content hash, written off the response path and evicted by size and age
+uploads_config = serving_config.get('uploads', {})
+persist_uploads = uploads_config.get('persist', True)
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=uploads_config.get('max_megabytes', 1024) * 1024 * 1024,
+    max_age_seconds=uploads_config.get('max_age_days', 30) * 24 * 3600,
+    thumbnail_size=uploads_config.get('thumbnail_size', 256),
+    max_workers=uploads_config.get('writer_workers', 2),
+    eviction_interval=uploads_config.get('eviction_interval_seconds', 300),
+    miss_wait_seconds=uploads_config.get('miss_wait_seconds', 1.0)
+)
+
+# Fetch remedy pages concurrently over a pooled session
+fetcher_config = serving_config.get('remedy_fetcher', {})
+page_fetcher = PageFetcher(
+    max_workers=fetcher_config.get('workers', 5),
+    deadline_seconds=fetcher_config.get('deadline_seconds', 8.0),
+    request_timeout=fetcher_config.get('request_timeout', 5.0)
+)
+
+# General recommendations used when no specific remedy is available
+def default_remedy(disease_name):
+    return {
+        "info": f"{disease_name} is a plant disease that requires proper management.",
+        "treatment": "Remove infected plant parts. Isolate infected plants from healthy ones.",
+        "prevention": "Practice crop rotation. Ensure proper plant spacing. Avoid overhead watering.",
+        "chemical_control": "Consult with a local agricultural extension for specific recommendations.",
+        "organic_control": "Organic options include neem oil, copper-based sprays, or horticultural oils.",
+        "source_note": "Could not retrieve specific information. These are general recommendations."
+    }
+
+# Candidate pages for a disease, preferring reliable agricultural domains
+def search_remedy_urls(disease_name):
+    # Imported on first lookup to keep server startup fast
+    from googlesearch import search
+
+    # Format the query to search for disease treatment
+    query = f"{disease_name} plant disease treatment remedy"
+    
+    # Search for relevant pages (limit to agricultural/gardening domains for better results)
+    search_results = list(search(query, num_results=5, lang="en"))
+    
+    # Filter for reliable agricultural domains if possible
+    reliable_domains = ['.edu', '.gov', 'extension.', 'gardening.', 'agriculture.']
+    filtered_results = [url for url in search_results if any(domain in url for domain in reliable_domains)]
+    
+    # Use filtered results if available, otherwise use original results
+    return filtered_results if filtered_results else search_results[:3]
+
+# Initialize remedy structure
+def empty_remedy():
+    return {
+        "info": "",
+        "treatment": "",
+        "prevention": "",
+        "chemical_control": "",
+        "organic_control": ""
+    }
+
+# Merge the sections extracted from one page; True once every field is filled
+def merge_remedy_page(remedy, page_text, disease_name):
+    # Classify every sentence of the page in a single pass
+    sections = extract_remedy_from_html(page_text, disease_name)
+    for field, text in sections.items():
+        if text and not remedy[field]:
+            remedy[field] = text
+    return all(remedy.values())
+
+# Fill in any missing sections with default content
+def complete_remedy(remedy, disease_name):
+    if not remedy["info"]:
+        remedy["info"] = f"{disease_name} is a plant disease that can affect crop health and yield."
+    
+    if not remedy["treatment"]:
+        remedy["treatment"] = "Remove infected plant parts. Ensure proper spacing for airflow. Avoid overhead watering."
+    
+    if not remedy["prevention"]:
+        remedy["prevention"] = "Rotate crops annually. Plant resistant varieties. Maintain good garden sanitation."
+    
+    if not remedy["chemical_control"]:
+        remedy["chemical_control"] = "Consult with a local agricultural extension for fungicide or pesticide recommendations specific to your area."
+    
+    if not remedy["organic_control"]:
+        remedy["organic_control"] = "Neem oil, copper-based fungicides, or horticultural oils can help control many common diseases organically."
+    
+    # Add a source note
+    remedy["source_note"] = "This information is automatically compiled from web sources and may not be complete. Consult with local agricultural experts for specific recommendations."
+    
+    return remedy
+
+# Function to fetch remedies; errors propagate so the remedy cache never
+# stores the general recommendations in place of a failed lookup
+def fetch_disease_remedy(disease_name):
+    # The whole lookup (search and page fetches) shares one deadline
+    deadline = page_fetcher.new_deadline()
+    urls_to_check = search_remedy_urls(disease_name)
+    remedy = empty_remedy()
+    
+    # Extract information from pages as they arrive
+    for url, page_text in page_fetcher.iter_pages(urls_to_check, deadline=deadline):
+        try:
+            # Stop early (cancelling outstanding fetches) once every field is filled
+            if merge_remedy_page(remedy, page_text, disease_name):
+                break
                 
-                # If we have most of the information, break
-                if all(remedy.values()):
-                    break
-                    
-            except Exception as e:
-                print(f"Error extracting from {url}: {e}")
-                continue
-        
-        # Fill in any missing sections with default content
-        if not remedy["info"]:
-            remedy["info"] = f"{disease_name} is a plant disease that can affect crop health and yield."
-        
-        if not remedy["treatment"]:
-            remedy["treatment"] = "Remove infected plant parts. Ensure proper spacing for airflow. Avoid overhead watering."
-        
-        if not remedy["prevention"]:
-            remedy["prevention"] = "Rotate crops annually. Plant resistant varieties. Maintain good garden sanitation."
-        
-        if not remedy["chemical_control"]:
-            remedy["chemical_control"] = "Consult with a local agricultural extension for fungicide or pesticide recommendations specific to your area."
-        
-        if not remedy["organic_control"]:
-            remedy["organic_control"] = "Neem oil, copper-based fungicides, or horticultural oils can help control many common diseases organically."
-        
-        # Add a source note
-        remedy["source_note"] = "This information is automatically compiled from web sources and may not be complete. Consult with local agricultural experts for specific recommendations."
-        
-        return remedy
-        
-    except Exception as e:
-        print(f"Error fetching remedy for {disease_name}: {e}")
-        # Return a default remedy if fetching fails
-        return {
-            "info": f"{disease_name} is a plant disease that requires proper management.",
-            "treatment": "Remove infected plant parts. Isolate infected plants from healthy ones.",
-            "prevention": "Practice crop rotation. Ensure proper plant spacing. Avoid overhead watering.",
-            "chemical_control": "Consult with a local agricultural extension for specific recommendations.",
-            "organic_control": "Organic options include neem oil, copper-based sprays, or horticultural oils.",
-            "source_note": "Could not retrieve specific information. These are general recommendations."
-        }
+        except Exception as e:
+            print(f"Error extracting from {url}: {e}")
+            continue
+    
+    # Nothing found (no search results or every page failed) is a failed lookup,
+    # not a remedy made only of the general defaults
+    if not any(remedy.values()):
+        raise LookupError(f"No remedy information found for {disease_name}")
+    return complete_remedy(remedy, disease_name)
+
+# Time the background web lookups
+def timed_fetch_disease_remedy(disease_name):
+    start = time.perf_counter()
+    try:
+        return fetch_disease_remedy(disease_name)
+    finally:
+        remedy_fetch_seconds.labels().observe(time.perf_counter() - start)
+
+# Keep remedies per class so predictions never wait on web scraping
+remedy_config = serving_config.get('remedy_cache', {})
+remedy_cache = RemedyCache(
+    timed_fetch_disease_remedy,
+    default_remedy,
+    path=remedy_config.get('path', 'models/remedy_cache.jsonl'),
+    ttl_seconds=remedy_config.get('ttl_hours', 168) * 3600,
+    retry_seconds=remedy_config.get('retry_seconds', 60),
+    max_workers=remedy_config.get('workers', 4)
+)
+
+# Start loading; remedies are pre-warmed once the model is ready so the web
+# lookups do not compete with model loading for CPU. Under gunicorn only one
+# worker pre-warms (CROP_REMEDY_PREWARM, set by gunicorn.conf.py)
+if remedy_config.get('prewarm', True) and os.environ.get('CROP_REMEDY_PREWARM', '1') == '1':
+    model.on_ready = lambda: remedy_cache.prewarm(class_names)
+model.start()
+
+# Values owned by other components, read when /metrics is scraped
+metrics.register_value('crop_model_ready', 'Whether the model is loaded and warmed up', 'gauge',
+                       lambda: int(model.ready))
+metrics.register_value('crop_model_load_seconds', 'Time taken to load the model', 'gauge', lambda: model.load_seconds)
+metrics.register_value('crop_model_warmup_seconds', 'Time taken to warm the model up', 'gauge',
+                       lambda: model.warmup_seconds)
+metrics.register_value('crop_result_cache_hits_total', 'Prediction cache hits', 'counter',
+                       lambda: result_cache.stats()['hits'])
+metrics.register_value('crop_result_cache_misses_total', 'Prediction cache misses', 'counter',
+                       lambda: result_cache.stats()['misses'])
+metrics.register_value('crop_remedy_cache_hits_total', 'Fresh remedy cache hits', 'counter',
+                       lambda: remedy_cache.stats()['hits'])
+metrics.register_value('crop_remedy_cache_stale_hits_total', 'Stale remedy cache hits (refreshed in background)',
+                       'counter', lambda: remedy_cache.stats()['stale_hits'])
+metrics.register_value('crop_remedy_cache_misses_total', 'Remedy cache misses', 'counter',
+                       lambda: remedy_cache.stats()['misses'])
+metrics.register_value('crop_upload_store_bytes', 'Bytes of uploads and thumbnails kept on disk', 'gauge',
+                       upload_store.total_bytes)
+metrics.register_value('crop_upload_store_evictions_total', 'Uploads removed by the retention policy', 'counter',
+                       lambda: upload_store.stats()['evictions'])
+metrics.register_histogram('crop_batch_size', 'Images per micro-batch forward pass', batcher.batch_size_histogram)
+metrics.register_histogram('crop_batch_queue_wait_seconds', 'Time images wait for their micro-batch',
+                           batcher.queue_wait_histogram)
+
+@app.after_request
+def record_request_timing(response):
+    timer = getattr(g, 'timer', None)
+    if timer is not None:
+        for stage, seconds in timer.stages:
+            stage_seconds.labels(endpoint=request.endpoint, stage=stage).observe(seconds)
+        stage_seconds.labels(endpoint=request.endpoint, stage='total').observe(timer.total())
+        if server_timing_enabled:
+            response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+# Returned by the prediction endpoints until the model is ready
+def model_not_ready():
+    response = jsonify({'error': 'Model is loading', 'status': model.status})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and answering, model or not
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: only route traffic here once the model is warmed up
+    return jsonify(model.stats()), 200 if model.ready else 503
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
+    if not model.ready:
+        return model_not_ready()
+    
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -295,46 +486,138 @@ def predict():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    # Save with a unique filename to avoid conflicts
-    import time
-    filename = f"{int(time.time())}_{file.filename}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    tiled = is_tiled_request(request.form.get('tiled'))
     
-    # Process image and predict
-    img = image.load_img(filepath, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
+    timer = g.timer = RequestTimer()
+    with timer.stage('read'):
+        data = file.read()
     
-    predictions = model.predict(img_array)[0]
+    # Resubmitted photos skip decoding and inference entirely
+    with timer.stage('cache_lookup'):
+        image_hash = content_hash(data)
+        cache_key = f"{image_hash}:tiled" if tiled else image_hash
+        prediction = result_cache.get(cache_key)
+    if prediction is None and tiled:
+        # Tiles are cropped and scored batch by batch from the decoded image
+        try:
+            with timer.stage('tiled_inference'):
+                prediction = predict_upload_tiled(data)
+        except Exception as e:
+            print(f"Error predicting tiles of {file.filename}: {e}")
+            return jsonify({'error': 'Invalid image file'}), 400
+        result_cache.put(cache_key, prediction)
+    elif prediction is None:
+        # Decode straight from the request body, no round trip through disk
+        try:
+            with timer.stage('decode'):
+                img_array = load_upload_array(data)
+        except Exception as e:
+            print(f"Error decoding {file.filename}: {e}")
+            return jsonify({'error': 'Invalid image file'}), 400
+        
+        with timer.stage('inference'):
+            predictions = batcher.predict(img_array)
+        with timer.stage('postprocess'):
+            prediction = summarize_predictions(predictions)
+            result_cache.put(image_hash, prediction)
     
-    # Get top 3 predictions
-    top_indices = predictions.argsort()[-3:][::-1]
-    top_predictions = [
-        {"class": class_names[i], "confidence": float(predictions[i])} 
-        for i in top_indices
-    ]
+    predicted_class = prediction["predicted_class"]
+    predictions_total.inc(predicted_class=predicted_class)
     
-    predicted_class = class_names[np.argmax(predictions)]
+    # Look up remedy information (refreshed from the web in the background)
+    with timer.stage('remedy'):
+        remedy = remedy_cache.get(predicted_class)
     
-    # Fetch remedy information dynamically
-    remedy = fetch_disease_remedy(predicted_class)
+    # Save under the content hash, identical photos only once (in the background)
+    image_url = thumbnail_url = None
+    if persist_uploads:
+        with timer.stage('persist'):
+            key, thumbnail_key = upload_store.save_async(image_hash, data)
+            image_url = f"/uploads/{key}"
+            thumbnail_url = f"/uploads/{thumbnail_key}"
     
     # Create the response with the remedy information
     result = {
         "predicted_class": predicted_class,
-        "confidence": float(predictions[np.argmax(predictions)]),
-        "top_predictions": top_predictions,
-        "image_url": f"/uploads/{filename}",
+        "confidence": prediction["confidence"],
+        "top_predictions": prediction["top_predictions"],
+        "image_url": image_url,
+        "thumbnail_url": thumbnail_url,
         "remedy": remedy
     }
+    if tiled:
+        result["tiles"] = prediction["tiles"]
     
-    return jsonify(result)
+    with timer.stage('serialize'):
+        response = jsonify(result)
+    return response
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    if not model.ready:
+        return model_not_ready()
+    
+    # Accept many 'files' (or 'file') parts; zip and tar archives are expanded
+    files = request.files.getlist('files') + request.files.getlist('file')
+    files = [file for file in files if file.filename != '']
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    # Take the uploads off the request before returning: the response below
+    # streams after the view has returned and the request streams are closed
+    uploads = spool_uploads(files, max_memory=batch_config.get('spool_megabytes', 8) * 1024 * 1024)
+    
+    def generate():
+        # One JSON object per line, flushed as soon as each batch completes
+        for filename, prediction in batch_predictor.predict_uploads(iter_uploads(uploads)):
+            result = {"filename": filename}
+            result.update(prediction)
+            if "predicted_class" in prediction:
+                predictions_total.inc(predicted_class=prediction["predicted_class"])
+                result["remedy"] = remedy_cache.get(prediction["predicted_class"])
+            yield json.dumps(result) + "\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Also runs when the client goes away before the stream starts
+    response.call_on_close(lambda: close_uploads(uploads))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats/batching', methods=['GET'])
+def batching_stats():
+    return jsonify(batcher.stats())
+
+@app.route('/api/stats/remedies', methods=['GET'])
+def remedy_stats():
+    return jsonify(remedy_cache.stats())
+
+@app.route('/api/stats/results', methods=['GET'])
+def result_cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/api/stats/uploads', methods=['GET'])
+def upload_stats():
+    return jsonify(upload_store.stats())
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # The upload may still be on its way to disk
+    upload_store.wait(filename)
+    info = upload_store.file_info(filename)
+    if info is None:
+        # Uploads saved under their original name before content-hash keys
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    
+    # Content-addressed files never change: revalidation by ETag or
+    # If-Modified-Since answers 304 without a body
+    path, etag, last_modified = info
+    response = send_file(path, etag=etag, last_modified=last_modified, conditional=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,222 @@
+# asgi.py
+"""
+asyncio front-end: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/api/predict and /uploads/<filename> are served on the event loop. Uploads
+are read without blocking, decoding runs in a thread pool and inference
+awaits the shared micro-batcher, so a slow client holds a coroutine rather
+than a worker thread. Remedy refreshes fetch their pages with async HTTP.
+Every other route is the Flask app from app.py, mounted as WSGI.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import app as core
+from serving.metrics import RequestTimer
+from serving.remedy_fetcher import AsyncPageFetcher
+from serving.upload_store import http_date, is_not_modified
+
+asgi_config = core.serving_config.get('asgi', {})
+decode_executor = ThreadPoolExecutor(max_workers=asgi_config.get('decode_workers', 4),
+                                     thread_name_prefix='asgi-decode')
+async_page_fetcher = AsyncPageFetcher(
+    max_connections=asgi_config.get('max_connections', 20),
+    deadline_seconds=core.fetcher_config.get('deadline_seconds', 8.0),
+    request_timeout=core.fetcher_config.get('request_timeout', 5.0)
+)
+
+
+async def fetch_disease_remedy_async(disease_name):
+    """fetch_disease_remedy with every page of the lookup fetched on the event loop"""
+    loop = asyncio.get_running_loop()
+    deadline = async_page_fetcher.new_deadline()
+    # googlesearch has no async API; keep it off the event loop
+    urls_to_check = await loop.run_in_executor(None, core.search_remedy_urls, disease_name)
+    remedy = core.empty_remedy()
+
+    pages = async_page_fetcher.iter_pages(urls_to_check, deadline=deadline)
+    try:
+        async for url, page_text in pages:
+            try:
+                # HTML parsing is CPU work, also kept off the loop
+                if await loop.run_in_executor(None, core.merge_remedy_page, remedy, page_text, disease_name):
+                    break
+            except Exception as e:
+                print(f"Error extracting from {url}: {e}")
+    finally:
+        # Cancels the outstanding fetches
+        await pages.aclose()
+
+    # Nothing found is a failed lookup, as in fetch_disease_remedy
+    if not any(remedy.values()):
+        raise LookupError(f"No remedy information found for {disease_name}")
+    return core.complete_remedy(remedy, disease_name)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+
+    # The page fetches stop at the fetcher deadline; the margin covers the
+    # search. Bounded so a stopped loop cannot block a remedy thread forever
+    # (and with it the executor join at shutdown)
+    fetch_timeout = async_page_fetcher.deadline_seconds + asgi_config.get('remedy_timeout_margin_seconds', 10)
+
+    def fetch_on_loop(disease_name):
+        # Called on a remedy cache worker thread; the I/O runs on the event loop
+        start = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(fetch_disease_remedy_async(disease_name), loop)
+        try:
+            return future.result(timeout=fetch_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+        finally:
+            core.remedy_fetch_seconds.labels().observe(time.perf_counter() - start)
+
+    core.remedy_cache.fetch_fn = fetch_on_loop
+    try:
+        yield
+    finally:
+        core.remedy_cache.fetch_fn = core.timed_fetch_disease_remedy
+        await async_page_fetcher.aclose()
+
+
+def record_timing(timer, response, endpoint):
+    """Same stage metrics and Server-Timing header as the Flask after_request hook"""
+    for stage, seconds in timer.stages:
+        core.stage_seconds.labels(endpoint=endpoint, stage=stage).observe(seconds)
+    core.stage_seconds.labels(endpoint=endpoint, stage='total').observe(timer.total())
+    if core.server_timing_enabled:
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+async def predict(request):
+    if not core.model.ready:
+        return JSONResponse({'error': 'Model is loading', 'status': core.model.status},
+                            status_code=503, headers={'Retry-After': '5'})
+
+    timer = RequestTimer()
+    loop = asyncio.get_running_loop()
+    # The multipart body is parsed as it streams in, without blocking the loop
+    with timer.stage('read'):
+        form = await request.form()
+    try:
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No file part'}, status_code=400)
+        if file.filename == '':
+            return JSONResponse({'error': 'No selected file'}, status_code=400)
+
+        data = await file.read()
+        filename = file.filename
+        tiled = core.is_tiled_request(form.get('tiled'))
+    finally:
+        await form.close()
+
+    # Resubmitted photos skip decoding and inference entirely
+    with timer.stage('cache_lookup'):
+        image_hash = core.content_hash(data)
+        cache_key = f"{image_hash}:tiled" if tiled else image_hash
+        prediction = core.result_cache.get(cache_key)
+    if prediction is None and tiled:
+        # Tiles are decoded and scored batch by batch, off the loop
+        try:
+            with timer.stage('tiled_inference'):
+                prediction = await loop.run_in_executor(decode_executor, core.predict_upload_tiled, data)
+        except Exception as e:
+            print(f"Error predicting tiles of {filename}: {e}")
+            return JSONResponse({'error': 'Invalid image file'}, status_code=400)
+        core.result_cache.put(cache_key, prediction)
+    elif prediction is None:
+        try:
+            with timer.stage('decode'):
+                img_array = await loop.run_in_executor(decode_executor, core.load_upload_array, data)
+        except Exception as e:
+            print(f"Error decoding {filename}: {e}")
+            return JSONResponse({'error': 'Invalid image file'}, status_code=400)
+
+        # Awaits the micro-batch without holding a thread
+        with timer.stage('inference'):
+            predictions = await asyncio.wrap_future(core.batcher.submit(img_array))
+        with timer.stage('postprocess'):
+            prediction = core.summarize_predictions(predictions)
+            core.result_cache.put(image_hash, prediction)
+
+    predicted_class = prediction["predicted_class"]
+    core.predictions_total.inc(predicted_class=predicted_class)
+
+    # Never waits on the web; refreshes run in the background
+    with timer.stage('remedy'):
+        remedy = core.remedy_cache.get(predicted_class)
+
+    image_url = thumbnail_url = None
+    if core.persist_uploads:
+        with timer.stage('persist'):
+            key, thumbnail_key = core.upload_store.save_async(image_hash, data)
+            image_url = f"/uploads/{key}"
+            thumbnail_url = f"/uploads/{thumbnail_key}"
+
+    result = {
+        "predicted_class": predicted_class,
+        "confidence": prediction["confidence"],
+        "top_predictions": prediction["top_predictions"],
+        "image_url": image_url,
+        "thumbnail_url": thumbnail_url,
+        "remedy": remedy
+    }
+    if tiled:
+        result["tiles"] = prediction["tiles"]
+
+    with timer.stage('serialize'):
+        response = JSONResponse(result)
+    return record_timing(timer, response, 'predict')
+
+
+async def uploaded_file(request):
+    filename = request.path_params['filename']
+    # The upload may still be on its way to disk
+    await run_in_threadpool(core.upload_store.wait, filename)
+    info = core.upload_store.file_info(filename)
+    if info is None:
+        # Uploads saved under their original name before content-hash keys
+        legacy_path = core.upload_store.legacy_path(filename)
+        if legacy_path is None:
+            return JSONResponse({'error': 'Not found'}, status_code=404)
+        return FileResponse(legacy_path)
+
+    # Content-addressed files never change: revalidation answers 304 without a body
+    path, etag, last_modified = info
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'public, max-age=31536000, immutable'
+    }
+    if is_not_modified(etag, last_modified, request.headers.get('if-none-match'),
+                       request.headers.get('if-modified-since')):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/predict', predict, methods=['POST']),
+        Route('/uploads/{filename}', uploaded_file, methods=['GET', 'HEAD']),
+        Mount('/', app=WSGIMiddleware(core.app))
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=core.CORS_ORIGINS, allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,90 @@
+# benchmarks/acceleration.py
+"""
+Compare XLA and precision settings for training and serving. For every
+combination of --xla off/on and --precisions it reports model.fit steps/s
+and images/s on synthetic batches, and images/s of the compiled
+fixed-shape serving function (KerasBackend) at each --serve_batch_sizes.
+
+Precisions the hardware cannot run natively fall back to float32 (and are
+reported as such), so on a CPU without AVX512-BF16/AMX the bfloat16 rows
+measure float32.
+
+Usage (from the repository root):
+    python benchmarks/acceleration.py --fit_steps 30 --serve_batches 50
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import tensorflow as tf
+
+from backends import PRECISIONS, KerasBackend
+from model import configure_precision, create_model
+
+
+def synthetic_dataset(batch_size, num_classes, input_shape):
+    """One fixed random batch repeated forever, so only the model is timed"""
+    images = np.random.rand(batch_size, *input_shape).astype(np.float32)
+    labels = np.eye(num_classes, dtype=np.float32)[np.random.randint(num_classes, size=batch_size)]
+    return tf.data.Dataset.from_tensors((images, labels)).repeat()
+
+
+def time_fit(xla, precision, args):
+    """(precision in effect, steps/s) of model.fit"""
+    precision = configure_precision(precision)
+    model, _ = create_model(args.num_classes, jit_compile=xla)
+    dataset = synthetic_dataset(args.batch_size, args.num_classes, (224, 224, 3))
+    model.fit(dataset, steps_per_epoch=3, epochs=1, verbose=0)  # Warm up / trace and compile
+    start = time.perf_counter()
+    model.fit(dataset, steps_per_epoch=args.fit_steps, epochs=1, verbose=0)
+    return precision, args.fit_steps / (time.perf_counter() - start)
+
+
+def time_serving(xla, precision, batch_size, args):
+    """(precision in effect, images/s) of the fixed-shape serving function"""
+    model, _ = create_model(args.num_classes)
+    backend = KerasBackend(model=model, xla=xla, precision=precision, batch_sizes=[batch_size])
+    batch = np.random.rand(batch_size, 224, 224, 3).astype(np.float32)
+    backend.predict(batch)  # Warm up / trace and compile
+    start = time.perf_counter()
+    for _ in range(args.serve_batches):
+        backend.predict(batch)
+    return backend.precision, args.serve_batches * batch_size / (time.perf_counter() - start)
+
+
+def reset():
+    tf.keras.mixed_precision.set_global_policy('float32')
+    tf.keras.backend.clear_session()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XLA / mixed precision benchmark')
+    parser.add_argument('--precisions', type=str, nargs='+', default=['float32', 'mixed_bfloat16'], choices=PRECISIONS)
+    parser.add_argument('--batch_size', type=int, default=32, help='Training batch size')
+    parser.add_argument('--num_classes', type=int, default=38)
+    parser.add_argument('--fit_steps', type=int, default=30, help='Timed model.fit steps (0 to skip training)')
+    parser.add_argument('--serve_batch_sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--serve_batches', type=int, default=50, help='Timed serving calls per batch size')
+    args = parser.parse_args()
+
+    for xla, precision in itertools.product([False, True], args.precisions):
+        label = f"xla={'on' if xla else 'off':<3} {precision:<14}"
+        if args.fit_steps:
+            reset()
+            used, steps_per_second = time_fit(xla, precision, args)
+            print(f"{label} model.fit ({used}): {steps_per_second:.2f} steps/s, "
+                  f"{steps_per_second * args.batch_size:.1f} images/s")
+        for batch_size in args.serve_batch_sizes:
+            reset()
+            used, images_per_second = time_serving(xla, precision, batch_size, args)
+            print(f"{label} serving batch {batch_size:<3} ({used}): {images_per_second:.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/input_pipeline.py
+"""
+Compare training input pipelines: ImageDataGenerator directories, packed
+shards and tf.data. Reports batches/s of the input alone and, with
+--fit_steps, training steps/s of model.fit fed by each pipeline.
+
+Usage (from the repository root):
+    python benchmarks/input_pipeline.py --steps 100 --fit_steps 50
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_preparation import create_data_generators, create_tf_datasets
+from model import create_model
+
+
+def build_pipeline(name, batch_size):
+    """Return (training input, number of classes) for a pipeline name"""
+    if name == 'tf_data':
+        train_ds, _, _, info = create_tf_datasets(batch_size)
+        return train_ds, len(info['class_names'])
+    data_format = 'shards' if name == 'shards' else 'directory'
+    train_generator, _, _ = create_data_generators(batch_size, data_format=data_format)
+    return train_generator, len(train_generator.class_indices)
+
+
+def iterate(train_input, steps):
+    """Pull batches only; works for both Keras iterators and tf.data"""
+    if hasattr(train_input, 'take'):
+        iterator = iter(train_input)
+        get_batch = lambda i: next(iterator)
+    else:
+        get_batch = lambda i: train_input[i % len(train_input)]
+
+    get_batch(0)  # Warm up (file listing, first decode, pipeline startup)
+    start = time.perf_counter()
+    for i in range(steps):
+        get_batch(i + 1)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Input pipeline benchmark')
+    parser.add_argument('--pipelines', type=str, nargs='+', default=['generator', 'tf_data'],
+                        choices=['generator', 'shards', 'tf_data'])
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--fit_steps', type=int, default=0, help='Also time this many model.fit steps')
+    args = parser.parse_args()
+
+    for name in args.pipelines:
+        train_input, num_classes = build_pipeline(name, args.batch_size)
+
+        elapsed = iterate(train_input, args.steps)
+        print(f"{name:<10} input only: {args.steps / elapsed:.2f} batches/s, "
+              f"{args.steps * args.batch_size / elapsed:.1f} images/s")
+
+        if args.fit_steps:
+            model, _ = create_model(num_classes)
+            model.fit(train_input, steps_per_epoch=2, epochs=1, verbose=0)  # Warm up / trace
+            start = time.perf_counter()
+            model.fit(train_input, steps_per_epoch=args.fit_steps, epochs=1, verbose=0)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<10} model.fit:  {args.fit_steps / elapsed:.2f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
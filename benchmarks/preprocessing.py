@@ -0,0 +1,120 @@
+# benchmarks/preprocessing.py
+"""
+Compare the shared preprocessing module (decode into a reused uint8 batch
+buffer, normalize in place) with the per-image code it replaced: keras
+load_img + img_to_array + expand_dims + / 255.0 (evaluation) and float32
+decode + MobileNetV2 preprocess_input (serving). Reports time and bytes
+allocated per image (tracemalloc sees NumPy's allocations).
+
+Usage (from the repository root):
+    python -m benchmarks.preprocessing --images "data/processed/test/*/*" --batch_size 32
+"""
+import argparse
+import glob
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from src.preprocessing import IMG_SIZE, BatchBuffer
+
+
+def legacy_keras_batch(paths):
+    """What evaluate.load_and_preprocess_image did, stacked into a batch"""
+    from tensorflow.keras.preprocessing import image
+
+    arrays = []
+    for path in paths:
+        img = image.load_img(path, target_size=IMG_SIZE)
+        img_array = image.img_to_array(img)
+        img_array = np.expand_dims(img_array, axis=0)
+        arrays.append(img_array / 255.0)
+    return np.concatenate(arrays)
+
+
+def legacy_serving_batch(datas):
+    """What app.py did per upload (float32 decode + preprocess_input), then np.stack in the batcher"""
+    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+    arrays = []
+    for data in datas:
+        img = Image.open(io.BytesIO(data))
+        if img.format == 'JPEG':
+            img.draft('RGB', IMG_SIZE)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != IMG_SIZE:
+            img = img.resize(IMG_SIZE, Image.NEAREST)
+        arrays.append(preprocess_input(np.asarray(img, dtype=np.float32)))
+    return np.stack(arrays)
+
+
+def shared_batch(buffer, sources):
+    for i, source in enumerate(sources):
+        buffer.decode(i, source)
+    return buffer.normalize(len(sources))
+
+
+def measure(fn, batches, repeats):
+    """(seconds per image, peak bytes allocated per image) over all batches"""
+    fn(batches[0])  # Warm up (imports, first allocation of buffers)
+    images = sum(len(batch) for batch in batches) * repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            fn(batch)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for batch in batches:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(batch)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return seconds / images, allocated / sum(len(batch) for batch in batches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preprocessing benchmark')
+    parser.add_argument('--images', type=str, default='data/processed/test/*/*', help='Glob of images')
+    parser.add_argument('--max_images', type=int, default=512)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--skip_keras', action='store_true', help='Skip the paths that need TensorFlow')
+    args = parser.parse_args()
+
+    paths = [path for path in sorted(glob.glob(args.images))
+             if path.lower().endswith(('.jpg', '.jpeg', '.png'))][:args.max_images]
+    if not paths:
+        raise SystemExit(f"No images match {args.images}")
+    datas = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            datas.append(f.read())
+
+    path_batches = [paths[i:i + args.batch_size] for i in range(0, len(paths), args.batch_size)]
+    data_batches = [datas[i:i + args.batch_size] for i in range(0, len(datas), args.batch_size)]
+    buffer = BatchBuffer(args.batch_size)
+
+    runs = {
+        "shared (paths)": (lambda batch: shared_batch(buffer, batch), path_batches),
+        "shared (bytes)": (lambda batch: shared_batch(buffer, batch), data_batches)
+    }
+    if not args.skip_keras:
+        runs["legacy evaluate (paths)"] = (legacy_keras_batch, path_batches)
+        runs["legacy serving (bytes)"] = (legacy_serving_batch, data_batches)
+
+    print(f"{len(paths)} images, batch size {args.batch_size}")
+    for name, (fn, batches) in runs.items():
+        seconds, allocated = measure(fn, batches, args.repeats)
+        print(f"{name:<24} {seconds * 1000:8.3f} ms/image  {allocated / 1024:9.1f} KiB allocated/image")
+
+
+if __name__ == "__main__":
+    main()
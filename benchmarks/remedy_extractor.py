@@ -0,0 +1,98 @@
+# benchmarks/remedy_extractor.py
+"""
+Compare the single-pass remedy extractor with the original per-keyword
+regex scans over a corpus of saved HTML pages.
+
+Usage (from the repository root):
+    python -m benchmarks.remedy_extractor --corpus data/remedy_pages --disease "Tomato Late blight"
+"""
+import argparse
+import glob
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from serving.remedy_extractor import extract_remedy_sections
+
+
+def legacy_extract(content, disease_name):
+    """The extraction loop fetch_disease_remedy() used to run on every page"""
+    remedy = {"info": "", "treatment": "", "prevention": "", "chemical_control": "", "organic_control": ""}
+
+    info_patterns = [
+        re.compile(r'(?:[A-Z][^.!?]*' + re.escape(disease_name) + r'[^.!?]*\.)', re.IGNORECASE),
+        re.compile(r'(?:[A-Z][^.!?]*symptoms[^.!?]*\.)', re.IGNORECASE),
+        re.compile(r'(?:[A-Z][^.!?]*disease[^.!?]*\.)', re.IGNORECASE)
+    ]
+    for pattern in info_patterns:
+        info_matches = pattern.findall(content)
+        if info_matches:
+            remedy["info"] = '. '.join(info_matches[:2])
+            break
+
+    section_patterns = [
+        ("treatment", [r'treatment', r'control', r'manage']),
+        ("prevention", [r'prevent', r'avoid']),
+        ("chemical_control", [r'fungicide', r'pesticide', r'chemical[^.!?]*control']),
+        ("organic_control", [r'organic', r'natural', r'non.?chemical'])
+    ]
+    for section, keywords in section_patterns:
+        for keyword in keywords:
+            pattern = re.compile(r'(?:[A-Z][^.!?]*' + keyword + r'[^.!?]*\.)', re.IGNORECASE)
+            matches = pattern.findall(content)
+            if matches:
+                remedy[section] = '. '.join(matches[:3])
+                break
+
+    return remedy
+
+
+def time_extractor(extract_fn, texts, disease_name, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            extract_fn(text, disease_name)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Remedy extractor micro-benchmark')
+    parser.add_argument('--corpus', type=str, default='data/remedy_pages', help='Directory of saved .html pages')
+    parser.add_argument('--disease', type=str, default='Late blight')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.corpus, '*.htm*')))
+    if not paths:
+        print(f"No .html pages found in {args.corpus}")
+        return
+
+    # Text extraction is shared by both implementations, so do it once up front
+    texts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            texts.append(BeautifulSoup(f.read(), 'html.parser').get_text())
+    total_mb = sum(len(text) for text in texts) / 1e6
+    print(f"Loaded {len(texts)} pages ({total_mb:.2f} MB of text)")
+
+    # Sections that differ (the legacy patterns skip sentences whose first word is the keyword)
+    differing = 0
+    for text in texts:
+        legacy = legacy_extract(text, args.disease)
+        current = extract_remedy_sections(text, args.disease)
+        differing += sum(1 for key in legacy if legacy[key] != current[key])
+    print(f"Sections differing from legacy output: {differing} of {len(texts) * 5}")
+
+    legacy_time = time_extractor(legacy_extract, texts, args.disease, args.repeats)
+    single_pass_time = time_extractor(extract_remedy_sections, texts, args.disease, args.repeats)
+
+    pages = len(texts) * args.repeats
+    print(f"Legacy (per-keyword scans): {legacy_time:.3f}s, {pages / legacy_time:.1f} pages/s")
+    print(f"Single pass:                {single_pass_time:.3f}s, {pages / single_pass_time:.1f} pages/s")
+    print(f"Speedup: {legacy_time / single_pass_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# benchmarks/serving.py
+"""
+Latency/throughput benchmark for the prediction API.
+
+Drives /api/predict through Flask's test client and through a real local
+server at a configurable concurrency, and micro-benchmarks each stage of a
+prediction. The remedy lookup is stubbed (no web traffic). Results are
+saved as JSON tagged with the current commit so runs can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.serving --requests 200 --concurrency 1 4 16
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import yaml
+
+
+def summarize(timings_ms, wall_seconds=None):
+    """p50/p95/p99/mean (ms) and throughput of a list of timings"""
+    timings = np.asarray(timings_ms, dtype=np.float64)
+    if len(timings) == 0:
+        return {"count": 0}
+    summary = {
+        "count": int(len(timings)),
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99))
+    }
+    wall_seconds = wall_seconds if wall_seconds is not None else timings.sum() / 1000
+    summary["throughput_per_s"] = float(len(timings) / wall_seconds) if wall_seconds else 0.0
+    return summary
+
+
+def load_images(pattern):
+    images = []
+    for path in sorted(glob.glob(pattern)):
+        if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(path, 'rb') as f:
+                images.append((os.path.basename(path), f.read()))
+    if not images:
+        raise SystemExit(f"No images match {pattern}")
+    return images
+
+
+def import_app(args):
+    """Import app.py with a benchmark config and the remedy lookup stubbed out"""
+    with open('configs/config.yaml', 'r') as f:
+        config = yaml.safe_load(f) or {}
+    serving = config.setdefault('serving', {})
+    serving.setdefault('remedy_cache', {})['prewarm'] = False
+    serving.setdefault('uploads', {})['persist'] = args.persist_uploads
+    if not args.result_cache:
+        serving.setdefault('result_cache', {})['max_megabytes'] = 0
+
+    config_file = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False)
+    yaml.safe_dump(config, config_file)
+    config_file.close()
+    os.environ['CROP_APP_CONFIG'] = config_file.name
+
+    import app as app_module
+    app_module.remedy_cache.get = app_module.default_remedy
+    if not app_module.model.wait():
+        raise SystemExit(f"Model failed to load: {app_module.model.error}")
+    return app_module
+
+
+def drive(send, images, total_requests, concurrency):
+    """Send total_requests predictions at the given concurrency; return latencies and wall time"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        name, data = images[i % len(images)]
+        start = time.perf_counter()
+        ok = send(name, data)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total_requests)))
+    wall = time.perf_counter() - start
+
+    result = summarize(latencies, wall)
+    result["concurrency"] = concurrency
+    result["errors"] = errors[0]
+    return result
+
+
+def bench_test_client(app_module, images, args):
+    local = threading.local()
+
+    def send(name, data):
+        if not hasattr(local, 'client'):
+            local.client = app_module.app.test_client()
+        response = local.client.post('/api/predict', data={'file': (io.BytesIO(data), name)},
+                                     content_type='multipart/form-data')
+        return response.status_code == 200
+
+    send(*images[0])  # Warm up
+    return [drive(send, images, args.requests, c) for c in args.concurrency]
+
+
+def bench_live_server(app_module, images, args):
+    import requests
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    url = f"http://127.0.0.1:{server.server_port}/api/predict"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    local = threading.local()
+
+    def send(name, data):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.post(url, files={'file': (name, data)})
+        return response.status_code == 200
+
+    try:
+        send(*images[0])  # Warm up
+        return [drive(send, images, args.requests, c) for c in args.concurrency]
+    finally:
+        server.shutdown()
+
+
+def time_stage(fn, iterations):
+    fn()  # Warm up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def bench_stages(app_module, images, args):
+    """Time each step of a prediction in isolation on the first image"""
+    from flask import jsonify
+    from tensorflow.keras.preprocessing import image
+    from src.preprocessing import normalize
+
+    name, data = images[0]
+    tmp_dir = tempfile.mkdtemp()
+    tmp_path = os.path.join(tmp_dir, name)
+
+    def upload_save():
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+    def load_img():
+        img = image.load_img(tmp_path, target_size=(224, 224))
+        return np.expand_dims(image.img_to_array(img), axis=0)
+
+    upload_save()
+    raw = load_img()
+    preprocessed = normalize(raw)
+    predictions = app_module.model.predict(preprocessed)[0]
+    prediction = app_module.summarize_predictions(predictions)
+    result = dict(prediction, image_url=None, remedy=app_module.default_remedy(prediction["predicted_class"]))
+
+    def serialize():
+        with app_module.app.app_context():
+            return jsonify(result).get_data()
+
+    stages = {
+        "upload_save": upload_save,
+        "load_img": load_img,
+        "decode_image_in_memory": lambda: app_module.load_upload_array(data),
+        "normalize": lambda: normalize(raw),
+        "model_predict": lambda: app_module.model.predict(preprocessed),
+        "top_k": lambda: app_module.summarize_predictions(predictions),
+        "json_serialization": serialize
+    }
+    return {stage: time_stage(fn, args.stage_iterations) for stage, fn in stages.items()}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serving latency benchmark')
+    parser.add_argument('--images', type=str, default='static/uploads/*', help='Glob of images to upload')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--stage_iterations', type=int, default=50)
+    parser.add_argument('--skip', type=str, nargs='*', default=[], choices=['test_client', 'live_server', 'stages'])
+    parser.add_argument('--persist_uploads', action='store_true', help='Keep writing uploads to disk')
+    parser.add_argument('--result_cache', action='store_true', help='Leave the prediction cache enabled')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON (default benchmarks/results/)')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    app_module = import_app(args)
+
+    commit = current_commit()
+    results = {"commit": commit, "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'), "args": vars(args)}
+
+    if 'test_client' not in args.skip:
+        results["test_client"] = bench_test_client(app_module, images, args)
+    if 'live_server' not in args.skip:
+        results["live_server"] = bench_live_server(app_module, images, args)
+    if 'stages' not in args.skip:
+        results["stages"] = bench_stages(app_module, images, args)
+
+    for mode in ['test_client', 'live_server']:
+        for run in results.get(mode, []):
+            print(f"{mode:<12} c={run['concurrency']:<3} p50 {run.get('p50_ms', 0):8.2f} ms  "
+                  f"p95 {run.get('p95_ms', 0):8.2f} ms  p99 {run.get('p99_ms', 0):8.2f} ms  "
+                  f"{run.get('throughput_per_s', 0):7.1f} req/s  errors {run['errors']}")
+    for stage, run in results.get("stages", {}).items():
+        print(f"{stage:<24} p50 {run['p50_ms']:8.3f} ms  p95 {run['p95_ms']:8.3f} ms  p99 {run['p99_ms']:8.3f} ms")
+
+    output = args.output or os.path.join('benchmarks', 'results', f"serving_{commit}_{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
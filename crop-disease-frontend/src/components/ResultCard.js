@@ -113,7 +113,7 @@ const ResultCard = ({ result }) => {
             }}
             >
             <img 
-                src={`http://localhost:5000${result.image_url}`} 
+                src={`http://localhost:5000${result.thumbnail_url || result.image_url}`} 
                 alt="Analyzed leaf" 
                 style={{ 
                 maxWidth: '100%', 
@@ -0,0 +1,82 @@
+# gunicorn.conf.py
+"""
+Production serving: gunicorn -c gunicorn.conf.py app:app
+
+Settings come from the serving.web and serving.inference_pool sections of
+configs/config.yaml. With inference_pool.processes > 0 the master starts one
+shared pool of inference processes before forking the web workers; the web
+workers then only decode uploads and look up remedies and hand their
+batches to the pool.
+"""
+import os
+
+import yaml
+
+from serving.inference_pool import InferencePool, install_client, pin_threads
+
+with open(os.environ.get('CROP_APP_CONFIG', 'configs/config.yaml'), 'r') as f:
+    serving_config = (yaml.safe_load(f) or {}).get('serving', {})
+web_config = serving_config.get('web', {})
+pool_config = serving_config.get('inference_pool', {})
+model_config = serving_config.get('model', {})
+
+# Leave the cores to the inference processes: cap the math thread pools in
+# the master before anything imports numpy, so the forked web workers
+# inherit the cap (the spawned inference processes set their own)
+pin_threads(web_config.get('math_threads', 1))
+
+from serving.model_loader import backend_options, warmup_batch_sizes  # noqa: E402 (after pin_threads)
+
+bind = web_config.get('bind', '0.0.0.0:5000')
+workers = web_config.get('workers', 2)
+threads = web_config.get('threads', 8)
+worker_class = 'gthread'
+timeout = web_config.get('timeout', 120)
+
+pool = None
+# The web worker that pre-warms the shared remedy cache; one is enough, the
+# others pick the remedies up from the cache file
+prewarm_worker = None
+
+
+def on_starting(server):
+    global pool
+    if pool_config.get('processes', 0) > 0:
+        pool = InferencePool(
+            model_config.get('path', 'models/saved_models/crop_disease_model.keras'),
+            backend=model_config.get('backend'),
+            processes=pool_config['processes'],
+            threads_per_process=pool_config.get('threads_per_process'),
+            slots=workers,
+            warmup_batch_sizes=warmup_batch_sizes(serving_config),
+            timeout=pool_config.get('timeout_seconds', 30),
+            backend_options=backend_options(serving_config)
+        ).start()
+
+
+def pre_fork(server, worker):
+    global prewarm_worker
+    worker.inference_slot = pool.acquire_slot() if pool is not None else None
+    worker.prewarm_remedies = prewarm_worker is None
+    if worker.prewarm_remedies:
+        prewarm_worker = worker
+
+
+def post_fork(server, worker):
+    # Read by app.py when the worker imports it
+    os.environ['CROP_REMEDY_PREWARM'] = '1' if worker.prewarm_remedies else '0'
+    if pool is not None:
+        install_client(pool.client(worker.inference_slot))
+
+
+def child_exit(server, worker):
+    global prewarm_worker
+    if worker is prewarm_worker:
+        prewarm_worker = None
+    if pool is not None:
+        pool.release_slot(getattr(worker, 'inference_slot', None))
+
+
+def on_exit(server):
+    if pool is not None:
+        pool.stop()
@@ -0,0 +1,179 @@
+# serving/batch_predict.py
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from serving.result_cache import content_hash
+from src.preprocessing import BatchBuffer
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+def _is_image_name(name):
+    basename = os.path.basename(name)
+    return basename.lower().endswith(IMAGE_EXTENSIONS) and not basename.startswith('.')
+
+
+def spool_uploads(files, max_memory=8 * 1024 * 1024):
+    """
+    Copy request file parts into (filename, file) pairs owned by the caller,
+    kept in memory up to max_memory bytes each and spilled to disk beyond
+    that. A streamed response outlives the request, whose upload streams
+    the framework may close as soon as the view returns.
+    """
+    spooled = []
+    try:
+        for file in files:
+            copy = tempfile.SpooledTemporaryFile(max_size=max_memory)
+            spooled.append((file.filename or '', copy))
+            shutil.copyfileobj(file.stream, copy)
+            copy.seek(0)
+    except Exception:
+        close_uploads(spooled)
+        raise
+    return spooled
+
+
+def close_uploads(uploads):
+    for _, file in uploads:
+        file.close()
+
+
+def iter_uploads(uploads):
+    """
+    Yield (filename, bytes) for every uploaded image of (filename, file)
+    pairs, expanding zip and tar archives member by member so only one
+    image is held in memory at a time
+    """
+    for name, file in uploads:
+        lower = name.lower()
+
+        if lower.endswith('.zip'):
+            with zipfile.ZipFile(file) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not _is_image_name(info.filename):
+                        continue
+                    yield info.filename, archive.read(info)
+
+        elif lower.endswith(TAR_EXTENSIONS):
+            # Stream mode reads the archive sequentially without seeking
+            with tarfile.open(fileobj=file, mode='r|*') as archive:
+                for member in archive:
+                    if not member.isfile() or not _is_image_name(member.name):
+                        continue
+                    yield member.name, archive.extractfile(member).read()
+
+        else:
+            yield name, file.read()
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BatchPredictor:
+    """
+    Run a stream of uploads through the model in fixed-size batches.
+
+    Images of the next batch are decoded on a thread pool, straight into a
+    reused batch buffer, while the current batch runs through the model, and
+    results are yielded batch by batch.
+    """
+    def __init__(self, predict_fn, decode_fn, summarize_fn, batch_size=32, max_workers=4, cache=None,
+                 pixel_inputs=False):
+        self.predict_fn = predict_fn
+        self.pixel_inputs = pixel_inputs  # predict_fn takes uint8 pixels and normalizes them itself
+        self.decode_fn = decode_fn  # decode_fn(data, out) fills one uint8 buffer row
+        self.summarize_fn = summarize_fn
+        self.batch_size = batch_size
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-decode')
+        self._buffers = []  # Idle buffers, shared by concurrent requests
+        self._buffers_lock = threading.Lock()
+
+    def _acquire_buffer(self):
+        with self._buffers_lock:
+            if self._buffers:
+                return self._buffers.pop()
+        return BatchBuffer(self.batch_size, pixel_inputs=self.pixel_inputs)
+
+    def _release_buffer(self, buffer):
+        with self._buffers_lock:
+            self._buffers.append(buffer)
+
+    def _prepare(self, filename, data, buffer, row):
+        """Return (filename, key, cached prediction, decoded, error)"""
+        key = content_hash(data)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return filename, key, cached, False, None
+        try:
+            self.decode_fn(data, out=buffer.pixels[row])
+            return filename, key, None, True, None
+        except Exception as e:
+            return filename, key, None, False, f"Invalid image file: {e}"
+
+    def _submit(self, chunk, buffer):
+        return [self._executor.submit(self._prepare, filename, data, buffer, row)
+                for row, (filename, data) in enumerate(chunk)]
+
+    def _run_batch(self, prepared, buffer):
+        to_predict = [i for i, item in enumerate(prepared) if item[3]]
+        predictions = {}
+        if to_predict:
+            inputs = buffer.batch(buffer.compact(to_predict))
+            outputs = np.asarray(self.predict_fn(inputs))
+            for i, output in zip(to_predict, outputs):
+                predictions[i] = self.summarize_fn(output)
+
+        for i, (filename, key, cached, _, error) in enumerate(prepared):
+            if error is not None:
+                yield filename, {"error": error}
+            elif cached is not None:
+                yield filename, cached
+            else:
+                if self.cache is not None:
+                    self.cache.put(key, predictions[i])
+                yield filename, predictions[i]
+
+    def predict_uploads(self, uploads):
+        """Yield (filename, prediction or {"error": ...}) for every upload"""
+        # Two buffers: one being decoded into while the other is predicted
+        buffers = [self._acquire_buffer(), self._acquire_buffer()]
+        pending = None
+        submitted = None
+        try:
+            for n, chunk in enumerate(chunked(uploads, self.batch_size)):
+                buffer = buffers[n % 2]
+                submitted = (self._submit(chunk, buffer), buffer)
+                if pending is not None:
+                    yield from self._run_batch([future.result() for future in pending[0]], pending[1])
+                pending, submitted = submitted, None
+            if pending is not None:
+                yield from self._run_batch([future.result() for future in pending[0]], pending[1])
+        finally:
+            # Closed early (e.g. the client disconnected while a batch was
+            # being yielded): both the batch being predicted and the one
+            # submitted after it may still be decoding into their buffers, so
+            # stop them before the buffers go back to the shared pool
+            in_flight = [future for batch in (pending, submitted) if batch is not None for future in batch[0]]
+            for future in in_flight:
+                future.cancel()
+            wait(in_flight)
+            for buffer in buffers:
+                self._release_buffer(buffer)
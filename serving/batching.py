@@ -0,0 +1,128 @@
+# serving/batching.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from serving.metrics import Histogram
+from src.preprocessing import BatchBuffer
+
+
+class MicroBatcher:
+    """
+    Collect single images from many request threads and run them through
+    the model in one forward pass per batch.
+
+    A batch is flushed when it reaches max_batch_size or when the oldest
+    queued image has waited max_wait_ms, whichever comes first. Images are
+    submitted as uint8 pixels and normalized into one reused batch buffer
+    (or, with pixel_inputs, passed on as uint8 for predict_fn to normalize).
+    """
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=10, pixel_inputs=False):
+        self.predict_fn = predict_fn
+        self.pixel_inputs = pixel_inputs
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._buffer = None  # Created for the first image's size
+        self._thread = None
+        self._running = False
+
+        # Batch sizes in images, queue waits in seconds
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_histogram = Histogram(
+            [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+        )
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, img_array):
+        """
+        Queue one decoded uint8 image (HxWxC or 1xHxWxC) and return a Future
+        that resolves to its prediction vector
+        """
+        if img_array.ndim == 4:
+            img_array = img_array[0]
+
+        future = Future()
+        self._queue.put((img_array, future, time.perf_counter()))
+        return future
+
+    def predict(self, img_array, timeout=None):
+        """Blocking helper: submit one image and wait for its predictions"""
+        return self.submit(img_array).result(timeout=timeout)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot()
+        }
+
+    def _collect(self):
+        """Block for the first item, then gather more until size or deadline"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _assemble(self, images):
+        """Copy the batch into the reused buffer and normalize it in place"""
+        if self._buffer is None:
+            self._buffer = BatchBuffer(self.max_batch_size, images[0].shape[:2], pixel_inputs=self.pixel_inputs)
+        for i, img in enumerate(images):
+            self._buffer.put(i, img)
+        return self._buffer.batch(len(images))
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            dispatched = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_histogram.observe(dispatched - enqueued)
+            self.batch_size_histogram.observe(len(batch))
+
+            futures = [future for _, future, _ in batch]
+            try:
+                inputs = self._assemble([img for img, _, _ in batch])
+                outputs = np.asarray(self.predict_fn(inputs))
+            except Exception as e:
+                print(f"Error running batch of {len(batch)}: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
@@ -0,0 +1,188 @@
+# serving/inference_pool.py
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+
+# numpy is imported inside the functions: the gunicorn master imports this
+# module to pin its thread pools, which only works before numpy loads BLAS
+
+# Environment variables the math libraries read for their thread pool sizes
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+
+# Client installed in this (web worker) process, see install_client
+_client = None
+
+
+def pin_threads(num_threads):
+    """
+    Cap the thread pools of this process at num_threads. Must run before
+    TensorFlow / the BLAS libraries are imported to take effect.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+
+def _inference_worker(index, request_queue, response_queues, ready_event, model_path, backend,
+                      backend_options, num_threads, warmup_batch_sizes, input_shape):
+    """Body of one inference process: load the model, warm it up, serve batches"""
+    pin_threads(num_threads)
+    import numpy as np
+    from src.backends import load_backend
+    from src.preprocessing import normalize
+
+    model = load_backend(model_path, backend=backend, num_threads=num_threads, **backend_options)
+    for batch_size in warmup_batch_sizes:
+        model.predict(np.zeros((batch_size,) + tuple(input_shape), dtype=np.float32))
+    print(f"Inference process {index} (pid {os.getpid()}) ready with {num_threads} threads")
+    ready_event.set()
+
+    while True:
+        item = request_queue.get()
+        if item is None:
+            break
+        slot, request_id, batch = item
+        try:
+            # Pixels arrive as uint8 (a quarter of the float32 bytes) and are normalized here
+            if batch.dtype == np.uint8:
+                batch = normalize(batch)
+            reply = (request_id, model.predict(batch), None)
+        except Exception as e:
+            reply = (request_id, None, f"{type(e).__name__}: {e}")
+        response_queues[slot].put(reply)
+
+
+class InferencePoolClient:
+    """
+    predict(batch) for one web worker process.
+
+    Batches go to the pool's shared request queue; replies come back on the
+    worker's own response queue and are matched to waiting callers by id, so
+    any number of threads can predict concurrently.
+    """
+    def __init__(self, request_queue, response_queue, slot, ready_event, timeout=30.0):
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.slot = slot
+        self.ready_event = ready_event
+        self.timeout = timeout
+
+        # Ids carry the pid so replies meant for a previous owner of the slot are ignored
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def _ensure_reader(self):
+        with self._lock:
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read, name='inference-replies', daemon=True)
+                self._reader.start()
+
+    def _read(self):
+        while True:
+            request_id, result, error = self.response_queue.get()
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(f"Inference process failed: {error}"))
+            else:
+                future.set_result(result)
+
+    def wait_ready(self, timeout=None):
+        """Block until at least one inference process has loaded and warmed up"""
+        return self.ready_event.wait(timeout)
+
+    def predict(self, batch, timeout=None):
+        import numpy as np
+        self._ensure_reader()
+        request_id = (os.getpid(), next(self._ids))
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        try:
+            # uint8 pixels go as is; anything else as float32 model input
+            dtype = np.uint8 if batch.dtype == np.uint8 else np.float32
+            self.request_queue.put((self.slot, request_id, np.ascontiguousarray(batch, dtype=dtype)))
+            return future.result(timeout=timeout or self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+
+class InferencePool:
+    """
+    Pool of inference processes shared by all web workers.
+
+    Each process holds one copy of the model and its math libraries are
+    pinned to threads_per_process threads, so processes * threads_per_process
+    can be matched to the number of cores. Created in the parent (e.g. the
+    gunicorn master) before the web workers fork; each web worker claims one
+    reply slot and talks to the pool through an InferencePoolClient.
+    """
+    def __init__(self, model_path, backend=None, processes=2, threads_per_process=None, slots=1,
+                 warmup_batch_sizes=(1,), input_shape=(224, 224, 3), timeout=30.0, backend_options=None):
+        self.processes = processes
+        self.threads_per_process = threads_per_process or max(1, (os.cpu_count() or 1) // processes)
+        self.timeout = timeout
+
+        # Spawned, not forked: the children must not inherit the parent's threads
+        context = multiprocessing.get_context('spawn')
+        self.request_queue = context.Queue()
+        self.response_queues = [context.Queue() for _ in range(slots)]
+        self.ready_event = context.Event()
+        self._free_slots = list(range(slots))
+        self._lock = threading.Lock()
+        self._processes = [
+            context.Process(
+                target=_inference_worker,
+                args=(i, self.request_queue, self.response_queues, self.ready_event, model_path, backend,
+                      backend_options or {}, self.threads_per_process, sorted(set(warmup_batch_sizes)), tuple(input_shape)),
+                name=f'inference-{i}',
+                daemon=True
+            )
+            for i in range(processes)
+        ]
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        print(f"Started {self.processes} inference processes with {self.threads_per_process} threads each")
+        return self
+
+    def stop(self, timeout=10):
+        for _ in self._processes:
+            self.request_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def acquire_slot(self):
+        with self._lock:
+            if not self._free_slots:
+                raise RuntimeError("No free inference pool slots; raise the number of slots to match the web workers")
+            return self._free_slots.pop(0)
+
+    def release_slot(self, slot):
+        with self._lock:
+            if slot is not None and slot not in self._free_slots:
+                self._free_slots.append(slot)
+
+    def client(self, slot):
+        return InferencePoolClient(self.request_queue, self.response_queues[slot], slot,
+                                   self.ready_event, timeout=self.timeout)
+
+
+def install_client(client):
+    """Route this process' predictions through the pool (called after fork)"""
+    global _client
+    _client = client
+
+
+def installed_client():
+    return _client
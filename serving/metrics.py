@@ -0,0 +1,192 @@
+# serving/metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram (cumulative counts, Prometheus style)
+    """
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return cumulative bucket counts, sum and count"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = []
+        running = 0
+        for bound, c in zip(self.buckets + ['+Inf'], counts):
+            running += c
+            cumulative.append({"le": bound, "count": running})
+
+        return {
+            "buckets": cumulative,
+            "sum": total,
+            "count": count,
+            "mean": total / count if count else 0.0
+        }
+
+    def samples(self, name, labels=None):
+        """Prometheus text samples (_bucket, _sum, _count)"""
+        labels = labels or {}
+        snapshot = self.snapshot()
+        lines = []
+        for bucket in snapshot["buckets"]:
+            bound = bucket["le"] if bucket["le"] == '+Inf' else _format_value(float(bucket["le"]))
+            lines.append(f'{name}_bucket{_format_labels(dict(labels, le=bound))} {bucket["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(snapshot["sum"]))}')
+        lines.append(f'{name}_count{_format_labels(labels)} {snapshot["count"]}')
+        return lines
+
+
+class HistogramFamily:
+    """
+    Histograms of one metric, one per combination of label values
+    """
+    def __init__(self, buckets, labelnames=()):
+        self.buckets = buckets
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = Histogram(self.buckets)
+            return self._children[key]
+
+    def samples(self, name):
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, histogram in sorted(children):
+            lines.extend(histogram.samples(name, dict(zip(self.labelnames, key))))
+        return lines
+
+
+class Counter:
+    """
+    Thread-safe counter with optional labels
+    """
+    def __init__(self, labelnames=()):
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, name):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}'
+                for key, value in values]
+
+
+class MetricsRegistry:
+    """
+    Collects metrics and renders them in the Prometheus text format.
+
+    Besides owned counters and histograms, callbacks can be registered to
+    report values that live elsewhere (cache statistics, batcher histograms).
+    """
+    def __init__(self):
+        self._metrics = []  # (name, help, type, samples_fn)
+
+    def register(self, name, help_text, metric_type, samples_fn):
+        self._metrics.append((name, help_text, metric_type, samples_fn))
+
+    def counter(self, name, help_text, labelnames=()):
+        counter = Counter(labelnames)
+        self.register(name, help_text, 'counter', lambda: counter.samples(name))
+        return counter
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        family = HistogramFamily(buckets, labelnames)
+        self.register(name, help_text, 'histogram', lambda: family.samples(name))
+        return family
+
+    def register_histogram(self, name, help_text, histogram):
+        """Expose a Histogram owned by another component"""
+        self.register(name, help_text, 'histogram', lambda: histogram.samples(name))
+
+    def register_value(self, name, help_text, metric_type, value_fn):
+        """Expose a single value (gauge or counter) read at scrape time"""
+        self.register(name, help_text, metric_type, lambda: [f'{name} {_format_value(value_fn())}'])
+
+    def render(self):
+        lines = []
+        for name, help_text, metric_type, samples_fn in self._metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            try:
+                lines.extend(samples_fn())
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """
+    Per-request stage durations, for metrics and the Server-Timing header
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []  # (stage, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages]
+        parts.append(f'total;dur={self.total() * 1000:.2f}')
+        return ', '.join(parts)
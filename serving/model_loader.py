@@ -0,0 +1,135 @@
+# serving/model_loader.py
+import threading
+import time
+
+import numpy as np
+
+
+def served_batch_sizes(serving_config):
+    """Batch sizes the server runs: single images plus the two batching paths"""
+    return [1,
+            serving_config.get('batching', {}).get('max_batch_size', 32),
+            serving_config.get('batch_endpoint', {}).get('batch_size', 32)]
+
+
+def batch_buckets(serving_config):
+    """
+    Batch sizes the keras backend compiles (serving.model.batch_sizes). With
+    xla and none configured: 1, 8 and the largest served batch size, so a
+    lone request is not padded up to a full batch.
+    """
+    model_config = serving_config.get('model', {})
+    sizes = model_config.get('batch_sizes')
+    if sizes:
+        return sorted(set(sizes))
+    if model_config.get('xla', False):
+        largest = max(served_batch_sizes(serving_config))
+        return sorted({size for size in (1, 8, largest) if size <= largest})
+    return None
+
+
+def warmup_batch_sizes(serving_config):
+    """Configured warm-up batch sizes (by default every batch size served) plus every compiled bucket"""
+    sizes = serving_config.get('model', {}).get('warmup_batch_sizes') or served_batch_sizes(serving_config)
+    return sorted(set(sizes) | set(batch_buckets(serving_config) or ()))
+
+
+def backend_options(serving_config):
+    """XLA / precision / compiled batch size options of the keras backend from serving.model"""
+    model_config = serving_config.get('model', {})
+    return {
+        "xla": model_config.get('xla', False),
+        "precision": model_config.get('precision', 'float32'),
+        "batch_sizes": batch_buckets(serving_config)
+    }
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when a prediction is requested before the model is warmed up"""
+
+
+class BackgroundModelLoader:
+    """
+    Load a model on a background thread and warm it up before serving.
+
+    Warm-up runs one dummy forward pass at every batch size the server will
+    use, so graph tracing / allocation happens before the first real request
+    rather than during it. predict() raises ModelNotReady until then.
+    """
+    def __init__(self, load_fn, warmup_batch_sizes=(1,), input_shape=(224, 224, 3), on_ready=None):
+        self.load_fn = load_fn
+        self.warmup_batch_sizes = sorted(set(warmup_batch_sizes))
+        self.input_shape = tuple(input_shape)
+        self.on_ready = on_ready
+
+        self.model = None
+        self.error = None
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            model = self.load_fn()
+            self.load_seconds = time.perf_counter() - start
+            print(f"Model loaded in {self.load_seconds:.2f}s")
+
+            start = time.perf_counter()
+            for batch_size in self.warmup_batch_sizes:
+                model.predict(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+            self.warmup_seconds = time.perf_counter() - start
+            print(f"Model warmed up at batch sizes {self.warmup_batch_sizes} in {self.warmup_seconds:.2f}s")
+
+            self.model = model
+            self._ready.set()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error loading model: {e}")
+        finally:
+            self._done.set()
+
+        if self._ready.is_set() and self.on_ready is not None:
+            try:
+                self.on_ready()
+            except Exception as e:
+                print(f"Error in model on_ready callback: {e}")
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def status(self):
+        if self._ready.is_set():
+            return 'ready'
+        if self._done.is_set():
+            return 'failed'
+        return 'loading'
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; returns True if the model is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def predict(self, batch):
+        if not self._ready.is_set():
+            raise ModelNotReady(f"Model is {self.status}")
+        return self.model.predict(batch)
+
+    def stats(self):
+        return {
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_batch_sizes": self.warmup_batch_sizes
+        }
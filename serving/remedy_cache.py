@@ -0,0 +1,221 @@
+# serving/remedy_cache.py
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single-process servers only
+    fcntl = None
+
+
+class RemedyCache:
+    """
+    Per-class remedy store with TTL refresh and JSON-lines persistence.
+
+    Lookups never block on the web: a fresh entry is returned as is, a stale
+    entry is returned while a background refresh runs (stale-while-revalidate)
+    and a missing entry returns fallback_fn(name) while it is fetched.
+
+    fetch_fn raises when a lookup fails. Failures are never stored: the
+    previous entry (or the fallback) keeps being served and the class is
+    retried after retry_seconds.
+
+    Several processes (gunicorn workers) can share one file: writes hold an
+    exclusive lock on {path}.lock, and a miss or stale entry first picks up
+    records other processes have appended since the file was last read.
+    """
+    def __init__(self, fetch_fn, fallback_fn, path='models/remedy_cache.jsonl',
+                 ttl_seconds=7 * 24 * 3600, retry_seconds=60, max_workers=4):
+        self.fetch_fn = fetch_fn
+        self.fallback_fn = fallback_fn
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+
+        self._entries = {}
+        self._inflight = set()
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='remedy')
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._file_mtime = None
+
+        self._load()
+
+    @contextmanager
+    def _locked_file(self):
+        """Hold the in-process and the cross-process lock of the cache file"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_file(self):
+        """Records of the JSON-lines log (last record per class wins) and the number of lines"""
+        records = {}
+        lines = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                    records[record['name']] = record
+                except (ValueError, KeyError) as e:
+                    print(f"Skipping bad remedy cache record: {e}")
+        return records, lines
+
+    def _merge(self, records):
+        """Keep the newest record per class; call with self._lock held"""
+        for name, record in records.items():
+            current = self._entries.get(name)
+            if current is None or record['fetched_at'] > current['fetched_at']:
+                self._entries[name] = record
+
+    def _sync_from_file(self):
+        """Pick up records appended by other processes since the last read"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._file_mtime:
+            return
+        with self._locked_file():
+            records, _ = self._read_file()
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            self._merge(records)
+
+    def _load(self):
+        """Replay the JSON-lines log and compact it"""
+        if not os.path.exists(self.path):
+            return
+
+        with self._locked_file():
+            records, lines = self._read_file()
+            with self._lock:
+                self._merge(records)
+            if lines > len(records):
+                self._write_compacted()
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+        print(f"Loaded {len(self._entries)} cached remedies from {self.path}")
+
+    def _write_compacted(self):
+        """Rewrite the file with one record per class; call with the file locked"""
+        directory = os.path.dirname(self.path) or '.'
+        # A unique temporary file in the same directory, then an atomic rename
+        fd, tmp_path = tempfile.mkstemp(prefix='.remedy_cache.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                with self._lock:
+                    records = list(self._entries.values())
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _append(self, record):
+        with self._locked_file():
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _is_stale(self, record):
+        return time.time() - record['fetched_at'] > self.ttl_seconds
+
+    def _refresh(self, name):
+        try:
+            remedy = self.fetch_fn(name)
+            record = {"name": name, "remedy": remedy, "fetched_at": time.time()}
+            with self._lock:
+                self._entries[name] = record
+                self._failed_at.pop(name, None)
+            self._append(record)
+        except Exception as e:
+            print(f"Error refreshing remedy for {name}: {e}")
+            with self._lock:
+                self._failed_at[name] = time.time()
+        finally:
+            with self._lock:
+                self._inflight.discard(name)
+
+    def _schedule_refresh(self, name):
+        with self._lock:
+            if name in self._inflight:
+                return None
+            if time.time() - self._failed_at.get(name, float('-inf')) < self.retry_seconds:
+                return None
+            self._inflight.add(name)
+        return self._executor.submit(self._refresh, name)
+
+    def get(self, name):
+        """Return the remedy for a class without waiting on a web fetch"""
+        with self._lock:
+            record = self._entries.get(name)
+        if record is None or self._is_stale(record):
+            # Another process may have fetched it already
+            self._sync_from_file()
+
+        with self._lock:
+            record = self._entries.get(name)
+            if record is None:
+                self.misses += 1
+            elif self._is_stale(record):
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+
+        if record is None:
+            self._schedule_refresh(name)
+            return self.fallback_fn(name)
+
+        if self._is_stale(record):
+            self._schedule_refresh(name)
+        return record['remedy']
+
+    def prewarm(self, names):
+        """Fetch every missing or stale class in the background"""
+        self._sync_from_file()
+        scheduled = 0
+        for name in names:
+            with self._lock:
+                record = self._entries.get(name)
+            if record is None or self._is_stale(record):
+                if self._schedule_refresh(name) is not None:
+                    scheduled += 1
+        print(f"Pre-warming remedy cache: {scheduled} of {len(names)} classes scheduled")
+        return scheduled
+
+    def stats(self):
+        with self._lock:
+            stale = sum(1 for record in self._entries.values() if self._is_stale(record))
+            return {
+                "entries": len(self._entries),
+                "stale": stale,
+                "refreshing": len(self._inflight),
+                "failed": len(self._failed_at),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds
+            }
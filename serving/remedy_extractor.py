@@ -0,0 +1,90 @@
+# serving/remedy_extractor.py
+import re
+
+# Same sentence shape the per-keyword patterns used: starts at a letter and
+# runs up to a full stop without crossing other sentence punctuation
+SENTENCE_PATTERN = re.compile(r'[A-Z][^.!?]*\.', re.IGNORECASE)
+
+# Every keyword of every remedy section in one alternation
+KEYWORD_PATTERN = re.compile(
+    r'treatment|control|manage|prevent|avoid|fungicide|pesticide|'
+    r'non.?chemical|chemical|organic|natural|symptoms|disease',
+    re.IGNORECASE
+)
+
+# Section -> (number of sentences kept, keyword groups in priority order).
+# "name" stands for the disease name, "chemical control" for "chemical"
+# followed by "control" in the same sentence.
+REMEDY_SECTIONS = {
+    "info": (2, ("name", "symptoms", "disease")),
+    "treatment": (3, ("treatment", "control", "manage")),
+    "prevention": (3, ("prevent", "avoid")),
+    "chemical_control": (3, ("fungicide", "pesticide", "chemical control")),
+    "organic_control": (3, ("organic", "natural", "non-chemical"))
+}
+
+# Largest number of sentences any section keeps
+MAX_SENTENCES = max(limit for limit, _ in REMEDY_SECTIONS.values())
+
+
+def classify_sentence(sentence, disease_name_lower):
+    """Return the set of keyword groups a sentence belongs to"""
+    groups = set()
+    first_chemical_end = None
+    last_control_start = None
+
+    for match in KEYWORD_PATTERN.finditer(sentence):
+        keyword = match.group(0).lower()
+        if keyword.startswith('non'):
+            groups.add('non-chemical')
+            keyword = 'chemical'
+
+        if keyword == 'chemical':
+            if first_chemical_end is None:
+                first_chemical_end = match.end()
+        elif keyword == 'control':
+            last_control_start = match.start()
+        groups.add(keyword)
+
+    if (first_chemical_end is not None and last_control_start is not None
+            and first_chemical_end <= last_control_start):
+        groups.add('chemical control')
+
+    if disease_name_lower and disease_name_lower in sentence.lower():
+        groups.add('name')
+
+    return groups
+
+
+def extract_remedy_sections(text, disease_name):
+    """
+    Split text into sentences once and sort each one into every remedy
+    section it matches. Returns a dict with all five sections (empty string
+    where nothing matched).
+    """
+    disease_name_lower = disease_name.lower()
+    matches = {}  # keyword group -> sentences in document order
+
+    for sentence_match in SENTENCE_PATTERN.finditer(text):
+        sentence = sentence_match.group(0)
+        for group in classify_sentence(sentence, disease_name_lower):
+            found = matches.setdefault(group, [])
+            if len(found) < MAX_SENTENCES:
+                found.append(sentence)
+
+    sections = {}
+    for section, (limit, groups) in REMEDY_SECTIONS.items():
+        sections[section] = ""
+        for group in groups:
+            if matches.get(group):
+                sections[section] = '. '.join(matches[group][:limit])
+                break
+    return sections
+
+
+def extract_remedy_from_html(html, disease_name):
+    """Extract the remedy sections from a fetched HTML page"""
+    # Imported on first use to keep server startup fast
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    return extract_remedy_sections(soup.get_text(), disease_name)
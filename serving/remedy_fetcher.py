@@ -0,0 +1,159 @@
+# serving/remedy_fetcher.py
+import asyncio
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class RequestsTransport:
+    """
+    HTTP transport backed by one pooled, keep-alive requests.Session
+    """
+    def __init__(self, pool_size=10, user_agent='Mozilla/5.0 (compatible; CropDiseaseBot/1.0)'):
+        # Imported here so the server does not pay for it at startup
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = user_agent
+
+    def get(self, url, timeout):
+        """Return the response body of url as text"""
+        response = self.session.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.text
+
+
+class PageFetcher:
+    """
+    Fetch candidate pages concurrently under one global deadline.
+
+    Any object with a get(url, timeout) -> str method can be used as the
+    transport, e.g. to point the fetcher at a local stub server.
+    """
+    def __init__(self, transport=None, max_workers=5, deadline_seconds=8.0, request_timeout=5.0):
+        self._transport = transport
+        self._transport_lock = threading.Lock()
+        self.max_workers = max_workers
+        self.deadline_seconds = deadline_seconds
+        self.request_timeout = request_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='page-fetch')
+
+    @property
+    def transport(self):
+        """The transport, creating the default pooled session on first use"""
+        with self._transport_lock:
+            if self._transport is None:
+                self._transport = RequestsTransport(pool_size=self.max_workers)
+            return self._transport
+
+    def new_deadline(self):
+        return time.monotonic() + self.deadline_seconds
+
+    def _get(self, url, deadline):
+        timeout = min(self.request_timeout, max(deadline - time.monotonic(), 0.1))
+        return self.transport.get(url, timeout=timeout)
+
+    def iter_pages(self, urls, deadline=None):
+        """
+        Yield (url, text) in completion order until every page is done or the
+        deadline passes. Closing the generator early (e.g. breaking out of the
+        loop once enough has been extracted) cancels the remaining fetches.
+        """
+        if deadline is None:
+            deadline = self.new_deadline()
+
+        pending = {self._executor.submit(self._get, url, deadline): url for url in urls}
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Page fetch deadline reached with {len(pending)} pages outstanding")
+                    break
+
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        print(f"Error fetching {url}: {e}")
+                        continue
+                    yield url, text
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class AsyncPageFetcher:
+    """
+    asyncio counterpart of PageFetcher: every page of a lookup is fetched
+    concurrently on the event loop over one pooled httpx.AsyncClient, without
+    a thread per request. Must be used from a single event loop.
+    """
+    def __init__(self, max_connections=10, deadline_seconds=8.0, request_timeout=5.0,
+                 user_agent='Mozilla/5.0 (compatible; CropDiseaseBot/1.0)'):
+        self.max_connections = max_connections
+        self.deadline_seconds = deadline_seconds
+        self.request_timeout = request_timeout
+        self.user_agent = user_agent
+        self._client = None
+
+    @property
+    def client(self):
+        """The HTTP client, created on first use"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={'User-Agent': self.user_agent},
+                follow_redirects=True
+            )
+        return self._client
+
+    def new_deadline(self):
+        return time.monotonic() + self.deadline_seconds
+
+    async def _get(self, url, deadline):
+        timeout = min(self.request_timeout, max(deadline - time.monotonic(), 0.1))
+        response = await self.client.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.text
+
+    async def iter_pages(self, urls, deadline=None):
+        """
+        Async generator of (url, text) in completion order, with the same
+        deadline and early-exit cancellation semantics as PageFetcher.iter_pages
+        """
+        if deadline is None:
+            deadline = self.new_deadline()
+
+        pending = {asyncio.ensure_future(self._get(url, deadline)): url for url in urls}
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Page fetch deadline reached with {len(pending)} pages outstanding")
+                    break
+
+                done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        print(f"Error fetching {url}: {e}")
+                        continue
+                    yield url, text
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
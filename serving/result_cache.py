@@ -0,0 +1,94 @@
+# serving/result_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """Hex SHA-256 digest of the uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed LRU cache of prediction results.
+
+    Entries are evicted least-recently-used first once their estimated size
+    exceeds max_bytes, and the whole cache is dropped whenever one of the
+    watched model files changes on disk.
+    """
+    def __init__(self, max_bytes=16 * 1024 * 1024, watch_paths=()):
+        self.max_bytes = max_bytes
+        self.watch_paths = list(watch_paths)
+
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._signature = self._model_signature()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _model_signature(self):
+        signature = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def _check_model(self):
+        """Clear the cache if a watched model file changed (call with lock held)"""
+        signature = self._model_signature()
+        if signature != self._signature:
+            print("Model files changed, invalidating prediction cache")
+            self._entries.clear()
+            self._bytes = 0
+            self._signature = signature
+            self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            self._check_model()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        # Rough in-memory footprint: serialized result plus key and bookkeeping
+        size = len(json.dumps(result)) + len(key) + 200
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_model()
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,318 @@
+# serving/upload_store.py
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single-process servers only
+    fcntl = None
+
+# Keys are <sha256 hex><ext> for originals and <sha256 hex>_thumb.jpg for thumbnails
+KEY_PATTERN = re.compile(r'^([0-9a-f]{64})(_thumb\.jpg|\.jpg|\.png|\.img)$')
+THUMBNAIL_SUFFIX = '_thumb.jpg'
+
+
+def image_extension(data):
+    """File extension from the image's magic bytes"""
+    if data[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    return '.img'
+
+
+def is_not_modified(etag, last_modified, if_none_match=None, if_modified_since=None):
+    """
+    Conditional GET check (RFC 9110): If-None-Match takes precedence over
+    If-Modified-Since. last_modified is a POSIX timestamp.
+    """
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded images.
+
+    Uploads are stored once per content hash under a sharded layout
+    (root/ab/cd/<hash>.<ext>) together with a downscaled JPEG thumbnail, and
+    written on a background thread, off the response path. A retention
+    policy (total size and age) is enforced by a background eviction thread;
+    an upload and its thumbnail are evicted together, least recently
+    uploaded first. Since a key names immutable content, it doubles as a
+    strong ETag.
+
+    Several worker processes may share root: eviction works from a scan of
+    the directory under a file lock (one evictor at a time, against the
+    total on disk), and a key missing from disk is polled for up to
+    miss_wait_seconds, as another worker may still be writing it.
+    """
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, max_age_seconds=30 * 24 * 3600,
+                 thumbnail_size=256, max_workers=2, eviction_interval=300, miss_wait_seconds=1.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.thumbnail_size = thumbnail_size
+        self.eviction_interval = eviction_interval
+        self.miss_wait_seconds = miss_wait_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-store')
+        self._pending = {}  # key -> Future of its write
+        self._index = {}  # key -> (bytes, last upload time), as of the last scan plus own writes
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.dedupe_hits = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._index = self._scan()
+        print(f"Upload store has {len(self._index)} files ({self.total_bytes() / 1024 / 1024:.1f} MB)")
+        self._stop = threading.Event()
+        self._evictor = threading.Thread(target=self._evict_loop, name='upload-evictor', daemon=True)
+        self._evictor.start()
+
+    def path(self, key):
+        """Absolute path of a key, or None for anything that is not a valid key"""
+        match = KEY_PATTERN.match(key)
+        if match is None:
+            return None
+        digest = match.group(1)
+        return os.path.join(self.root, digest[:2], digest[2:4], key)
+
+    def _scan(self):
+        """Index of the files on disk (written by any process): key -> (bytes, last upload time)"""
+        index = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if KEY_PATTERN.match(filename):
+                    try:
+                        stat = os.stat(os.path.join(directory, filename))
+                    except FileNotFoundError:
+                        continue  # Evicted meanwhile
+                    index[filename] = (stat.st_size, max(stat.st_atime, stat.st_mtime))
+        return index
+
+    def _write_file(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._index[key] = (len(data), time.time())
+
+    def _thumbnail(self, data):
+        img = Image.open(io.BytesIO(data))
+        img.draft('RGB', (self.thumbnail_size, self.thumbnail_size))
+        img = img.convert('RGB')
+        img.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=80, optimize=True)
+        return out.getvalue()
+
+    def _write(self, key, thumbnail_key, data):
+        try:
+            self._write_file(key, data)
+            try:
+                self._write_file(thumbnail_key, self._thumbnail(data))
+            except Exception as e:
+                print(f"Error creating thumbnail for {key}: {e}")
+        except Exception as e:
+            print(f"Error saving upload {key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._pending.pop(thumbnail_key, None)
+
+    def _touch(self, key):
+        """
+        Mark an existing upload as recently uploaded again. Only the access
+        time is bumped: the content and so Last-Modified stay the same.
+        """
+        path = self.path(key)
+        now = time.time()
+        try:
+            stat = os.stat(path)
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            return False
+        with self._lock:
+            self._index[key] = (stat.st_size, now)
+        return True
+
+    def save_async(self, digest, data):
+        """
+        Store an upload under its content hash (sha256 hex) and return
+        (key, thumbnail key). Identical uploads are stored only once.
+        """
+        key = f"{digest}{image_extension(data)}"
+        thumbnail_key = f"{digest}{THUMBNAIL_SUFFIX}"
+        with self._lock:
+            if key in self._pending:
+                self.dedupe_hits += 1
+                return key, thumbnail_key
+            known = key in self._index and thumbnail_key in self._index
+        if known and self._touch(key) and self._touch(thumbnail_key):
+            with self._lock:
+                self.dedupe_hits += 1
+            return key, thumbnail_key
+
+        with self._lock:
+            future = self._executor.submit(self._write, key, thumbnail_key, data)
+            self._pending[key] = future
+            self._pending[thumbnail_key] = future
+        return key, thumbnail_key
+
+    def wait(self, key, timeout=5):
+        """
+        Block until a pending write of key has finished. A key that is
+        neither pending here nor on disk may be being written by another
+        worker process, so the disk is polled for up to miss_wait_seconds.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            future.result(timeout=timeout)
+            return
+        path = self.path(key)
+        if path is None:
+            return
+        deadline = time.monotonic() + min(timeout, self.miss_wait_seconds)
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(size for size, _ in self._index.values())
+
+    def _remove(self, keys):
+        """Remove the files of one upload (original and thumbnail); False if any could not be removed"""
+        removed = True
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error evicting upload {key}: {e}")
+                removed = False
+                continue
+            with self._lock:
+                self._index.pop(key, None)
+        return removed
+
+    def _eviction_lock(self):
+        """Open and lock the eviction lock file, or None if another process is evicting"""
+        lock_file = open(os.path.join(self.root, '.evict.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def evict(self):
+        """
+        Drop expired uploads, then the oldest until under max_bytes; returns
+        the number of uploads removed (0 if another process is evicting)
+        """
+        lock_file = self._eviction_lock()
+        if lock_file is None:
+            return 0
+        try:
+            index = self._scan()
+            with self._lock:
+                self._index = index
+                pending = set(self._pending)
+
+            # An upload is its original plus thumbnail, last uploaded when either was
+            uploads = {}
+            for key, (size, uploaded) in index.items():
+                entry = uploads.setdefault(key[:64], [0, 0, []])
+                entry[0] = max(entry[0], uploaded)
+                entry[1] += size
+                entry[2].append(key)
+            total = sum(size for _, size, _ in uploads.values())
+
+            removed = 0
+            cutoff = time.time() - self.max_age_seconds if self.max_age_seconds else None
+            for uploaded, size, keys in sorted(uploads.values()):
+                expired = cutoff is not None and uploaded < cutoff
+                over_budget = self.max_bytes and total > self.max_bytes
+                if not (expired or over_budget):
+                    break
+                if pending.intersection(keys):
+                    continue
+                if self._remove(keys):
+                    total -= size
+                    removed += 1
+        finally:
+            lock_file.close()  # Releases the flock
+        with self._lock:
+            self.evictions += removed
+        if removed:
+            print(f"Evicted {removed} uploads, {total / 1024 / 1024:.1f} MB remain")
+        return removed
+
+    def _evict_loop(self):
+        while not self._stop.wait(self.eviction_interval):
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"Error evicting uploads: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    def legacy_path(self, filename):
+        """
+        Path of a file saved under its original name (/uploads/<ts>_<name>,
+        from before content-hash keys) directly in the root, or None
+        """
+        if (KEY_PATTERN.match(filename) or filename.startswith('.')
+                or os.path.basename(filename) != filename):
+            return None
+        path = os.path.join(self.root, filename)
+        return path if os.path.isfile(path) else None
+
+    def file_info(self, key):
+        """(path, ETag, Last-Modified timestamp) of a stored key, or None"""
+        path = self.path(key)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return path, key, stat.st_mtime
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": sum(size for size, _ in self._index.values()),
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "pending_writes": len(self._pending),
+                "dedupe_hits": self.dedupe_hits,
+                "evictions": self.evictions
+            }
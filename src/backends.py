@@ -0,0 +1,219 @@
+# src/backends.py
+import threading
+
+import numpy as np
+
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+
+
+def cpu_supports_bfloat16():
+    """True if the CPU advertises native bfloat16 instructions (Linux /proc/cpuinfo)"""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return any(flag in flags for flag in ('avx512_bf16', 'amx_bf16'))
+
+
+def resolve_precision(precision):
+    """Validate a precision name and fall back to float32 where the hardware cannot run it"""
+    precision = precision or 'float32'
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    if precision == 'float32':
+        return precision
+
+    import tensorflow as tf
+    has_gpu = bool(tf.config.list_physical_devices('GPU'))
+    if precision == 'mixed_bfloat16' and not (has_gpu or cpu_supports_bfloat16()):
+        print("CPU has no native bfloat16 support; using float32")
+        return 'float32'
+    if precision == 'mixed_float16' and not has_gpu:
+        print("float16 needs a GPU; using float32")
+        return 'float32'
+    return precision
+
+
+def _configure_inference_precision(precision):
+    """
+    Let grappler rewrite graph-mode inference to bfloat16 on oneDNN CPUs.
+    Applies to tf.function graphs, so the model needs no rebuilding; only
+    mixed_bfloat16 is supported this way. Returns the precision in effect.
+    """
+    import tensorflow as tf
+
+    precision = resolve_precision(precision)
+    if precision == 'mixed_float16':
+        print("Only bfloat16 inference is supported; using float32")
+        return 'float32'
+    tf.config.optimizer.set_experimental_options(
+        {'auto_mixed_precision_onednn_bfloat16': precision == 'mixed_bfloat16'}
+    )
+    return precision
+
+
+class KerasBackend:
+    """
+    Serve the full Keras model.
+
+    With batch_sizes, inference runs through tf.functions traced for exactly
+    those batch sizes (optionally XLA-compiled, one compilation per size).
+    A batch is split into chunks of the largest size and the remainder is
+    padded up to the smallest size that fits it, so a lone image at low
+    load runs at batch 1 rather than at the largest size.
+    precision='mixed_bfloat16' lets grappler run those graphs in bfloat16 on
+    CPUs that support it.
+    """
+    name = 'keras'
+
+    def __init__(self, model_path=None, model=None, xla=False, precision='float32', batch_sizes=None):
+        if model is None:
+            from tensorflow.keras.models import load_model
+            model = load_model(model_path)
+        self.model = model
+        self.batch_sizes = sorted(set(batch_sizes)) if batch_sizes else []
+        self.precision = 'float32'
+        self._compiled = None
+        if self.batch_sizes or xla or precision != 'float32':
+            self._compile(xla, precision)
+
+    def _compile(self, xla, precision):
+        import tensorflow as tf
+
+        self.precision = _configure_inference_precision(precision)
+        sample_shape = tuple(self.model.input_shape[1:])
+
+        def serving_function(batch_size):
+            return tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=[tf.TensorSpec((batch_size,) + sample_shape, tf.float32)],
+                jit_compile=xla
+            )
+
+        if self.batch_sizes:
+            self._compiled = {size: serving_function(size) for size in self.batch_sizes}
+            self._padded = {size: np.zeros((size,) + sample_shape, dtype=np.float32) for size in self.batch_sizes}
+        else:
+            self._compiled = serving_function(None)
+        self._lock = threading.Lock()
+        print(f"Serving function: batch {self.batch_sizes or 'any'}, xla={xla}, precision={self.precision}")
+
+    def _run_bucketed(self, batch):
+        largest = self.batch_sizes[-1]
+        outputs = []
+        with self._lock:
+            for start in range(0, len(batch), largest):
+                chunk = batch[start:start + largest]
+                size = next(size for size in self.batch_sizes if size >= len(chunk))
+                if len(chunk) == size:
+                    outputs.append(np.asarray(self._compiled[size](chunk)))
+                else:
+                    padded = self._padded[size]
+                    padded[:len(chunk)] = chunk
+                    outputs.append(np.asarray(self._compiled[size](padded))[:len(chunk)])
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+    def predict(self, batch):
+        if self._compiled is None:
+            return np.asarray(self.model.predict_on_batch(batch))
+        batch = np.asarray(batch, dtype=np.float32)
+        if self.batch_sizes:
+            return self._run_bucketed(batch)
+        return np.asarray(self._compiled(batch))
+
+
+class TFLiteBackend:
+    """
+    Serve an exported .tflite model with the TFLite interpreter
+    """
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input_detail['shape'][0])
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch):
+        """Map float input onto the int8/uint8 input tensor of a fully quantized model"""
+        dtype = self.input_detail['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self.input_detail['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if self.output_detail['dtype'] == np.float32:
+            return output
+        scale, zero_point = self.output_detail['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_detail['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input_detail['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_detail['index'])
+        return self._dequantize(output)
+
+
+class OnnxBackend:
+    """
+    Serve an exported .onnx model with ONNX Runtime
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend
+}
+
+
+def backend_for_path(model_path):
+    """Guess the backend from a model file extension"""
+    if model_path.endswith('.tflite'):
+        return 'tflite'
+    if model_path.endswith('.onnx'):
+        return 'onnx'
+    return 'keras'
+
+
+def load_backend(model_path, backend=None, num_threads=None, xla=False, precision='float32', batch_sizes=None):
+    """
+    Load a model behind a common predict(batch) -> probabilities interface.
+    xla, precision and batch_sizes only apply to the keras backend.
+    """
+    backend = backend or backend_for_path(model_path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {list(BACKENDS)}")
+    print(f"Loading {backend} model from {model_path}")
+    if backend == 'keras':
+        return KerasBackend(model_path, xla=xla, precision=precision, batch_sizes=batch_sizes)
+    return BACKENDS[backend](model_path, num_threads=num_threads)
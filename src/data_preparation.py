@@ -1,5 +1,10 @@
 # src/data_preparation.py
 import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cv2
 import numpy as np
 from sklearn.model_selection import train_test_split
@@ -7,28 +12,102 @@ import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tqdm.auto import tqdm  # Changed this import
 
+from preprocessing import RESCALE, BatchBuffer, normalize
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _process_chunk(tasks, img_size):
+    """
+    Worker: resize a list of (source, output, checksum known) images,
+    skipping outputs that are newer than their source. Returns one manifest
+    record per image, with the SHA-256 and size of every written output
+    (and of skipped outputs whose checksum is not known yet).
+    """
+    records = []
+    for path, output_path, checksum_known in tasks:
+        record = {"source": path, "output": output_path, "status": "processed"}
+        try:
+            if (os.path.exists(output_path)
+                    and os.path.getmtime(output_path) >= os.path.getmtime(path)):
+                record["status"] = "skipped"
+                record["size"] = os.path.getsize(output_path)
+                if not checksum_known:
+                    record["sha256"] = _sha256(output_path)
+            else:
+                img = cv2.imread(path)
+                if img is None:
+                    print(f"Warning: Could not read image {path}")
+                    record["status"] = "failed"
+                    records.append(record)
+                    continue
+
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                img = cv2.resize(img, img_size)
+
+                # Save the processed image (write then rename so an interrupted run leaves no partial file)
+                ok, encoded = cv2.imencode(os.path.splitext(output_path)[1], cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+                if not ok:
+                    raise ValueError("could not encode image")
+                data = encoded.tobytes()
+                tmp_path = f"{output_path}.part"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, output_path)
+                # Checksum the bytes already in memory instead of re-reading the file
+                record["sha256"] = hashlib.sha256(data).hexdigest()
+                record["size"] = len(data)
+        except Exception as e:
+            print(f"Error processing {path}: {str(e)}")
+            record["status"] = "failed"
+        records.append(record)
+    return records
+
 def process_dataset(raw_data_dir='data/raw/PlantVillage/color', 
                    processed_dir='data/processed',
-                   img_size=(224, 224)):
+                   img_size=(224, 224),
+                   num_workers=None,
+                   chunk_size=64,
+                   pack=False,
+                   shard_size=2048):
     """
-    Process raw dataset: resize images and split into train/val/test sets
+    Process raw dataset: resize images and split into train/val/test sets.
+
+    Images are resized on a process pool in chunks of chunk_size files.
+    Outputs newer than their source are skipped, so an interrupted run
+    resumes where it stopped, and {processed_dir}/manifest.json records
+    every processed file with its SHA-256 checksum (computed by the workers
+    from the bytes they write). With pack=True the result is also packed
+    into memory-mappable shards (see pack_shards).
     """
     print(f"Starting to process dataset from {raw_data_dir}")
+    start_time = time.time()
     
     # Create processed directories
     os.makedirs(f'{processed_dir}/train', exist_ok=True)
     os.makedirs(f'{processed_dir}/val', exist_ok=True)
     os.makedirs(f'{processed_dir}/test', exist_ok=True)
     
+    # Previous manifest lets skipped files keep their checksum without rehashing
+    manifest_path = f'{processed_dir}/manifest.json'
+    previous_manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            previous_manifest = json.load(f).get('files', {})
+    
     # Get all class folders
     class_folders = [f for f in os.listdir(raw_data_dir) 
                      if os.path.isdir(os.path.join(raw_data_dir, f))]
     
     print(f"Found {len(class_folders)} class folders")
     
-    for class_folder in tqdm(class_folders, desc="Processing classes"):
-        print(f"Processing class: {class_folder}")
-        
+    # Build the work list in the parent so the split stays deterministic
+    tasks = []
+    for class_folder in class_folders:
         # Create class directories in train/val/test
         os.makedirs(f'{processed_dir}/train/{class_folder}', exist_ok=True)
         os.makedirs(f'{processed_dir}/val/{class_folder}', exist_ok=True)
@@ -39,48 +118,239 @@ def process_dataset(raw_data_dir='data/raw/PlantVillage/color',
                     for img in os.listdir(os.path.join(raw_data_dir, class_folder))
                     if img.lower().endswith(('.jpg', '.jpeg', '.png'))]
         
-        print(f"  - Found {len(img_paths)} images")
-        
         # Split into train (70%), validation (15%), and test (15%)
         train_paths, test_val_paths = train_test_split(img_paths, test_size=0.3, random_state=42)
         val_paths, test_paths = train_test_split(test_val_paths, test_size=0.5, random_state=42)
         
-        print(f"  - Split: {len(train_paths)} train, {len(val_paths)} val, {len(test_paths)} test")
+        print(f"  - {class_folder}: {len(train_paths)} train, {len(val_paths)} val, {len(test_paths)} test")
         
-        # Process and save images
         for subset, paths in [
             ('train', train_paths),
             ('val', val_paths),
             ('test', test_paths)
         ]:
-            for i, path in enumerate(paths):
-                try:
-                    if i % 10 == 0:  # Show progress every 10 images
-                        print(f"  - Processing {subset}: {i}/{len(paths)}")
-                        
-                    img = cv2.imread(path)
-                    if img is None:
-                        print(f"Warning: Could not read image {path}")
-                        continue
-                        
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    img = cv2.resize(img, img_size)
-                    
-                    # Save the processed image
-                    filename = os.path.basename(path)
-                    output_path = f'{processed_dir}/{subset}/{class_folder}/{filename}'
-                    cv2.imwrite(output_path, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-                except Exception as e:
-                    print(f"Error processing {path}: {str(e)}")
+            for path in paths:
+                filename = os.path.basename(path)
+                output_path = f'{processed_dir}/{subset}/{class_folder}/{filename}'
+                previous = previous_manifest.get(os.path.relpath(output_path, processed_dir), {})
+                tasks.append((path, output_path, bool(previous.get("sha256"))))
+    
+    # Process and save images across a process pool
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    counts = {"processed": 0, "skipped": 0, "failed": 0}
+    manifest = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(_process_chunk, chunk, img_size) for chunk in chunks]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing images"):
+            for record in future.result():
+                counts[record["status"]] += 1
+                if record["status"] == "failed":
+                    continue
+                
+                relative_path = os.path.relpath(record["output"], processed_dir)
+                checksum = record.get("sha256") or previous_manifest[relative_path]["sha256"]
+                manifest[relative_path] = {
+                    "source": record["source"],
+                    "sha256": checksum,
+                    "size": record["size"]
+                }
+    
+    # Write the manifest of processed files
+    with open(manifest_path, 'w') as f:
+        json.dump({"img_size": list(img_size), "files": manifest}, f, indent=1)
+    
+    elapsed = time.time() - start_time
+    print(f"Processed {counts['processed']}, skipped {counts['skipped']} up-to-date, "
+          f"{counts['failed']} failed in {elapsed:.1f}s")
+    if counts['processed']:
+        print(f"Throughput: {counts['processed'] / elapsed:.1f} images/s")
+    print(f"Manifest written to {manifest_path}")
+    
+    if pack:
+        pack_shards(processed_dir, f'{processed_dir}/shards', img_size, shard_size, num_workers)
     
     print("Dataset processing completed.")
-def create_data_generators(batch_size=32):
+
+def _pack_shard(paths, labels, images_path, labels_path, img_size):
+    """
+    Worker: decode one shard's images into a uint8 .npy file. Unreadable
+    images are dropped together with their labels; returns the number of
+    images packed.
+    """
+    images = np.lib.format.open_memmap(
+        images_path, mode='w+', dtype=np.uint8, shape=(len(paths), img_size[1], img_size[0], 3)
+    )
+    kept_labels = []
+    for path, label in zip(paths, labels):
+        img = cv2.imread(path)
+        if img is None:
+            print(f"Warning: Could not read image {path}, leaving it out of the shard")
+            continue
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if (img.shape[1], img.shape[0]) != tuple(img_size):
+            img = cv2.resize(img, img_size)
+        images[len(kept_labels)] = img
+        kept_labels.append(label)
+    images.flush()
+    
+    # Rewrite the shard without the unused trailing rows
+    count = len(kept_labels)
+    if count < len(paths):
+        tmp_path = f"{images_path}.part.npy"
+        compact = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(count,) + images.shape[1:])
+        compact[:] = images[:count]
+        compact.flush()
+        del compact
+        del images
+        os.replace(tmp_path, images_path)
+    else:
+        del images
+    np.save(labels_path, np.asarray(kept_labels, dtype=np.int32))
+    return count
+
+def pack_shards(processed_dir='data/processed', shard_dir='data/processed/shards',
+                img_size=(224, 224), shard_size=2048, num_workers=None):
+    """
+    Pack the processed train/val/test JPEGs into uint8 NxHxWx3 .npy shards
+    plus label shards and an index.json, so epochs can read decoded pixels
+    straight from memory-mapped files instead of decoding every JPEG
+    """
+    print(f"Packing {processed_dir} into shards of {shard_size} images in {shard_dir}")
+    os.makedirs(shard_dir, exist_ok=True)
+    
+    # Same alphabetical class order as flow_from_directory
+    class_names = sorted(f for f in os.listdir(f'{processed_dir}/train')
+                         if os.path.isdir(os.path.join(processed_dir, 'train', f)))
+    index = {"class_names": class_names, "img_size": list(img_size), "subsets": {}}
+    
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for subset in ['train', 'val', 'test']:
+            paths, labels = [], []
+            for label, class_name in enumerate(class_names):
+                class_dir = os.path.join(processed_dir, subset, class_name)
+                if not os.path.isdir(class_dir):
+                    continue
+                for filename in sorted(os.listdir(class_dir)):
+                    if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                        paths.append(os.path.join(class_dir, filename))
+                        labels.append(label)
+            
+            shards = []
+            futures = []
+            for shard_id, start in enumerate(range(0, len(paths), shard_size)):
+                images_file = f'{subset}-{shard_id:05d}-images.npy'
+                labels_file = f'{subset}-{shard_id:05d}-labels.npy'
+                futures.append(executor.submit(
+                    _pack_shard, paths[start:start + shard_size], labels[start:start + shard_size],
+                    os.path.join(shard_dir, images_file), os.path.join(shard_dir, labels_file), img_size
+                ))
+                shards.append({"images": images_file, "labels": labels_file})
+            
+            for shard, future in zip(shards, tqdm(futures, desc=f"Packing {subset}")):
+                shard["count"] = future.result()
+            
+            count = sum(shard["count"] for shard in shards)
+            index["subsets"][subset] = {"count": count, "shards": shards}
+            print(f"  - {subset}: {count} images in {len(shards)} shards"
+                  + (f" ({len(paths) - count} unreadable left out)" if count < len(paths) else ""))
+    
+    with open(os.path.join(shard_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+class ShardSequence(tf.keras.utils.Sequence):
+    """
+    Batches from packed shards, read zero-copy through memory-mapped .npy
+    files. Exposes samples, classes and class_indices like the
+    flow_from_directory iterators so it can be used in their place.
+
+    With a datagen every image is augmented and standardized by it; without
+    one, batches are gathered into a reused uint8 buffer and normalized in
+    one vectorized pass by the shared preprocessing module.
+    """
+    def __init__(self, shard_dir, subset, batch_size=32, shuffle=True, datagen=None, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        with open(os.path.join(shard_dir, 'index.json'), 'r') as f:
+            index = json.load(f)
+        
+        shards = index["subsets"][subset]["shards"]
+        self.images = [np.load(os.path.join(shard_dir, shard["images"]), mmap_mode='r') for shard in shards]
+        labels = [np.load(os.path.join(shard_dir, shard["labels"])) for shard in shards]
+        
+        self.class_indices = {name: i for i, name in enumerate(index["class_names"])}
+        self.num_classes = len(self.class_indices)
+        self.classes = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int32)
+        self.samples = len(self.classes)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.datagen = datagen
+        self._local = threading.local()
+        
+        # Global position -> (shard, offset within shard)
+        shard_sizes = [len(l) for l in labels]
+        shard_starts = np.cumsum([0] + shard_sizes[:-1])
+        self._shard_of = np.repeat(np.arange(len(shard_sizes)), shard_sizes)
+        self._offset_of = np.arange(self.samples) - shard_starts[self._shard_of]
+        
+        self._rng = np.random.default_rng(seed)
+        self.index_array = np.arange(self.samples)
+        if self.shuffle:
+            self._rng.shuffle(self.index_array)
+    
+    def __len__(self):
+        return (self.samples + self.batch_size - 1) // self.batch_size
+    
+    def __getitem__(self, idx):
+        batch_indices = self.index_array[idx * self.batch_size:(idx + 1) * self.batch_size]
+        batch_y = tf.keras.utils.to_categorical(self.classes[batch_indices], self.num_classes)
+        
+        if self.datagen is None:
+            # One staging buffer per loader thread
+            buffer = getattr(self._local, 'buffer', None)
+            if buffer is None:
+                buffer = self._local.buffer = BatchBuffer(self.batch_size, self.images[0].shape[1:3])
+            for i, j in enumerate(batch_indices):
+                buffer.put(i, self.images[self._shard_of[j]][self._offset_of[j]])
+            # A fresh output array: Keras may still hold on to the previous batch
+            return normalize(buffer.pixels[:len(batch_indices)]), batch_y
+        
+        batch_x = np.empty((len(batch_indices),) + self.images[0].shape[1:], dtype=np.float32)
+        for i, j in enumerate(batch_indices):
+            batch_x[i] = self.images[self._shard_of[j]][self._offset_of[j]]
+        
+        # Same augmentation and rescaling as the directory generators
+        for i in range(len(batch_x)):
+            params = self.datagen.get_random_transform(batch_x[i].shape)
+            batch_x[i] = self.datagen.apply_transform(batch_x[i], params)
+            batch_x[i] = self.datagen.standardize(batch_x[i])
+        
+        return batch_x, batch_y
+    
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._rng.shuffle(self.index_array)
+
+def create_unaugmented_generator(subset, batch_size=32, data_format='directory', shard_dir='data/processed/shards'):
+    """Rescaled, unshuffled generator over one subset (no augmentation)"""
+    if data_format == 'shards':
+        return ShardSequence(shard_dir, subset, batch_size, shuffle=False)
+    datagen = ImageDataGenerator(rescale=RESCALE)
+    return datagen.flow_from_directory(
+        f'data/processed/{subset}',
+        target_size=(224, 224),
+        batch_size=batch_size,
+        class_mode='categorical',
+        shuffle=False
+    )
+
+def create_data_generators(batch_size=32, data_format='directory', shard_dir='data/processed/shards'):
     """
-    Create data generators for training, validation, and testing
+    Create data generators for training, validation, and testing.
+    data_format='shards' reads the packed shards written by pack_shards
+    instead of decoding the JPEG directories every epoch.
     """
     # Data augmentation for training
     train_datagen = ImageDataGenerator(
-        rescale=1./255,
+        rescale=RESCALE,
         rotation_range=20,
         width_shift_range=0.2,
         height_shift_range=0.2,
@@ -91,8 +361,14 @@ def create_data_generators(batch_size=32):
     )
     
     # Only rescale validation and test data
-    valid_datagen = ImageDataGenerator(rescale=1./255)
-    test_datagen = ImageDataGenerator(rescale=1./255)
+    valid_datagen = ImageDataGenerator(rescale=RESCALE)
+    test_datagen = ImageDataGenerator(rescale=RESCALE)
+    
+    if data_format == 'shards':
+        train_generator = ShardSequence(shard_dir, 'train', batch_size, shuffle=True, datagen=train_datagen)
+        valid_generator = ShardSequence(shard_dir, 'val', batch_size, shuffle=False)
+        test_generator = ShardSequence(shard_dir, 'test', batch_size, shuffle=False)
+        return train_generator, valid_generator, test_generator
     
     # Create generators
     train_generator = train_datagen.flow_from_directory(
@@ -118,5 +394,90 @@ def create_data_generators(batch_size=32):
     
     return train_generator, valid_generator, test_generator
 
+def _list_image_files(subset_dir, class_names):
+    """(paths, labels) for every image under subset_dir/<class>/, in class order"""
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(subset_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                paths.append(os.path.join(class_dir, filename))
+                labels.append(label)
+    return paths, labels
+
+def create_tf_datasets(batch_size=32, data_dir='data/processed', img_size=(224, 224), cache=True,
+                       num_shards=1, shard_index=0):
+    """
+    tf.data replacement for create_data_generators: files are decoded in
+    parallel, training batches are augmented with vectorized Keras
+    preprocessing layers, val/test are cached un-augmented (as uint8) after
+    the first pass, and every dataset is prefetched.
+
+    With num_shards > 1 (multi-worker training) each dataset only reads
+    every num_shards-th file starting at shard_index, before decoding, and
+    tf.distribute's own auto-sharding is turned off. batch_size is then the
+    global batch size, which tf.distribute splits across the replicas.
+
+    Returns (train_ds, valid_ds, test_ds, info) where info holds the class
+    names and sample counts that the generators used to expose.
+    """
+    AUTOTUNE = tf.data.AUTOTUNE
+    class_names = sorted(f for f in os.listdir(f'{data_dir}/train')
+                         if os.path.isdir(os.path.join(data_dir, 'train', f)))
+    num_classes = len(class_names)
+    
+    def load_image(path, label):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img = tf.image.resize(img, img_size, method='nearest')
+        return tf.cast(img, tf.uint8), tf.one_hot(label, num_classes)
+    
+    def rescale(images, labels):
+        return tf.cast(images, tf.float32) * RESCALE, labels
+    
+    # Same augmentation ranges as the ImageDataGenerator (shear has no layer equivalent)
+    augmentation = tf.keras.Sequential([
+        tf.keras.layers.RandomRotation(20 / 360, fill_mode='nearest'),
+        tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomZoom(0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomFlip('horizontal')
+    ])
+    
+    def augment(images, labels):
+        return augmentation(images, training=True), labels
+    
+    def build(subset, training):
+        paths, labels = _list_image_files(f'{data_dir}/{subset}', class_names)
+        ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+        if num_shards > 1:
+            ds = ds.shard(num_shards, shard_index)
+        if training:
+            ds = ds.shuffle(len(paths), reshuffle_each_iteration=True)
+        ds = ds.map(load_image, num_parallel_calls=AUTOTUNE)
+        if not training and cache:
+            ds = ds.cache()
+        ds = ds.batch(batch_size).map(rescale, num_parallel_calls=AUTOTUNE)
+        if training:
+            ds = ds.map(augment, num_parallel_calls=AUTOTUNE).repeat()
+        if num_shards > 1:
+            options = tf.data.Options()
+            options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+            ds = ds.with_options(options)
+        return ds.prefetch(AUTOTUNE), len(paths)
+    
+    train_ds, train_samples = build('train', training=True)
+    valid_ds, valid_samples = build('val', training=False)
+    test_ds, test_samples = build('test', training=False)
+    
+    print(f"tf.data pipeline: {train_samples} train, {valid_samples} val, {test_samples} test images")
+    info = {
+        "class_names": class_names,
+        "train_samples": train_samples,
+        "valid_samples": valid_samples,
+        "test_samples": test_samples
+    }
+    return train_ds, valid_ds, test_ds, info
+
 if __name__ == "__main__":
     process_dataset()
\ No newline at end of file
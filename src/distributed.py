@@ -0,0 +1,116 @@
+# src/distributed.py
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+def free_ports(count):
+    """count distinct free TCP ports on localhost"""
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('localhost', 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def _worker_main(index, workers, num_threads, target, kwargs):
+    """Body of one training process: join the cluster, then run target(strategy=..., **kwargs)"""
+    # Read by MultiWorkerMirroredStrategy when it is created
+    os.environ['TF_CONFIG'] = json.dumps({
+        "cluster": {"worker": workers},
+        "task": {"type": "worker", "index": index}
+    })
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING
+        )
+    )
+    print(f"Training worker {index} (pid {os.getpid()}): {strategy.num_replicas_in_sync} replicas, "
+          f"{num_threads} threads")
+    target(strategy=strategy, **kwargs)
+
+def launch_workers(target, num_workers, threads_per_worker=None, **kwargs):
+    """
+    Run target(strategy=strategy, **kwargs) in num_workers local processes
+    that form one MultiWorkerMirroredStrategy cluster on localhost, and wait
+    for all of them. The cores are split evenly between the workers. If any
+    worker fails the others are stopped (they would otherwise block in
+    their next collective) and a RuntimeError is raised.
+    """
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    workers = [f'localhost:{port}' for port in free_ports(num_workers)]
+
+    # Spawned, not forked: TensorFlow must not be inherited half-initialized
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_worker_main, args=(i, workers, threads_per_worker, target, kwargs),
+                        name=f'train-worker-{i}')
+        for i in range(num_workers)
+    ]
+    print(f"Starting {num_workers} training workers ({', '.join(workers)}) with {threads_per_worker} threads each")
+    for process in processes:
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            failed = [process for process in processes if process.exitcode not in (None, 0)]
+            if failed:
+                raise RuntimeError(f"Training worker {failed[0].name} exited with code {failed[0].exitcode}")
+            time.sleep(1)
+        failed = [process for process in processes if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Training worker {failed[0].name} exited with code {failed[0].exitcode}")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+def worker_info(strategy):
+    """(number of workers, index of this worker) of a strategy; (1, 0) outside a cluster"""
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None:
+        return 1, 0
+    workers = resolver.cluster_spec().as_dict().get('worker', [])
+    return max(1, len(workers)), resolver.task_id or 0
+
+def is_chief(strategy):
+    """True on worker 0, which writes the checkpoints, logs and final model"""
+    return worker_info(strategy)[1] == 0
+
+def worker_output_path(path, strategy, scratch_dir):
+    """
+    Where this worker writes path (a checkpoint or log directory): path
+    itself on the chief, a location inside scratch_dir on the other
+    workers. Keras callbacks have no chief handling of their own, so
+    without this every worker would write to path at the same time.
+    """
+    if strategy is None or is_chief(strategy):
+        return path
+    return os.path.join(scratch_dir, path.replace(os.sep, '_'))
+
+def save_model(model, path, strategy=None):
+    """
+    model.save(path) that works under a multi-worker strategy: every worker
+    has to take part in saving, but only the chief writes to path; the
+    others write to a temporary directory that is removed again.
+    """
+    if strategy is None or is_chief(strategy):
+        model.save(path)
+        return
+    tmp_dir = tempfile.mkdtemp(prefix=f'worker_{worker_info(strategy)[1]}_')
+    try:
+        model.save(os.path.join(tmp_dir, os.path.basename(path)))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -3,27 +3,41 @@ import numpy as np
 import matplotlib.pyplot as plt
 import tensorflow as tf
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
 import os
-from sklearn.metrics import classification_report, confusion_matrix
+import csv
+import json
+import glob
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import seaborn as sns
 
+from backends import load_backend
+from preprocessing import RESCALE, BatchBuffer, load_image, predict_tiled
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
 def load_and_preprocess_image(img_path, target_size=(224, 224)):
     """Load and preprocess a single image"""
-    img = image.load_img(img_path, target_size=target_size)
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = img_array / 255.0
-    return img_array
+    return load_image(img_path, target_size)
+
+@lru_cache(maxsize=4)
+def load_cached_model(model_path):
+    """Load a Keras model once per path and reuse it on later calls"""
+    return load_model(model_path)
+
+@lru_cache(maxsize=4)
+def load_class_names(class_names_path):
+    with open(class_names_path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
 
 def predict_disease(model_path, img_path, class_names_path):
     """Predict disease for a single image"""
-    # Load model
-    model = load_model(model_path)
+    # Load model (cached across calls)
+    model = load_cached_model(model_path)
     
     # Load class names
-    with open(class_names_path, 'r') as f:
-        class_names = [line.strip() for line in f.readlines()]
+    class_names = load_class_names(class_names_path)
     
     # Load and preprocess image
     img_array = load_and_preprocess_image(img_path)
@@ -40,48 +54,276 @@ def predict_disease(model_path, img_path, class_names_path):
     
     return predicted_class, confidence, top_3_predictions
 
-def evaluate_model(model_path, test_data_dir, class_names_path, batch_size=32):
-    """Evaluate model on test dataset"""
-    # Load model
-    model = load_model(model_path)
+@lru_cache(maxsize=4)
+def load_cached_backend(model_path):
+    """Load an inference backend once per path and reuse it on later calls"""
+    return load_backend(model_path)
+
+def predict_disease_tiled(model_path, img_path, class_names_path, overlap=0.25, batch_size=32,
+                          max_side=None, aggregate='mean', heatmap_path=None):
+    """
+    Predict disease for a large image from overlapping 224x224 tiles (see
+    preprocessing.predict_tiled). With heatmap_path, the tile probabilities
+    of the predicted class are plotted there.
+    Returns (predicted_class, confidence, top_3_predictions, tiled result).
+    """
+    model = load_cached_backend(model_path)
+    class_names = load_class_names(class_names_path)
     
-    # Load class names
-    with open(class_names_path, 'r') as f:
-        class_names = [line.strip() for line in f.readlines()]
+    result = predict_tiled(model.predict, img_path, overlap=overlap, batch_size=batch_size,
+                           max_side=max_side, aggregate=aggregate)
+    probabilities = result["probabilities"]
+    predicted_class_idx = int(np.argmax(probabilities))
+    top_3_idx = np.argsort(probabilities)[-3:][::-1]
+    top_3_predictions = [(class_names[idx], probabilities[idx]) for idx in top_3_idx]
     
-    # Create data generator
-    test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
-    test_generator = test_datagen.flow_from_directory(
+    if heatmap_path:
+        save_heatmap(result, predicted_class_idx, class_names[predicted_class_idx], heatmap_path)
+    return class_names[predicted_class_idx], probabilities[predicted_class_idx], top_3_predictions, result
+
+def save_heatmap(result, class_index, class_name, output_path):
+    """Plot one class' tile probabilities from predict_tiled over the image area"""
+    width, height = result["image_size"]
+    plt.figure(figsize=(8, 8 * height / width))
+    plt.imshow(result["heatmap"][..., class_index], cmap='inferno', vmin=0, vmax=1,
+               extent=(0, width, height, 0), interpolation='nearest')
+    plt.colorbar(label='Tile probability')
+    plt.title(f'{class_name} ({result["heatmap"].shape[0]}x{result["heatmap"].shape[1]} tiles)')
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+
+def iter_image_paths(inputs):
+    """
+    Expand directories (recursively), glob patterns and .txt file lists
+    into image paths
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for filename in sorted(files):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, filename)
+        elif any(ch in item for ch in '*?['):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+        elif item.lower().endswith('.txt'):
+            with open(item, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield line.strip()
+        else:
+            yield item
+
+def _decode_for_batch(path, buffer, row):
+    """Decode one image into a buffer row; returns (path, error)"""
+    try:
+        buffer.decode(row, path)
+        return path, None
+    except Exception as e:
+        return path, str(e)
+
+def predict_images(model_path, inputs, class_names_path, output_path='predictions.csv',
+                   batch_size=32, num_workers=4, top_k=3):
+    """
+    Score many images with one model load: images are decoded on a thread
+    pool (the next batch while the current one runs), predicted in batches
+    and written to CSV or JSONL (by output_path extension) as they finish
+    """
+    model = load_backend(model_path)
+    class_names = load_class_names(class_names_path)
+    paths = list(iter_image_paths(inputs))
+    print(f"Scoring {len(paths)} images with batch size {batch_size}")
+    
+    as_jsonl = output_path.endswith(('.jsonl', '.json'))
+    start_time = time.time()
+    scored = 0
+    
+    with open(output_path, 'w', newline='') as f, ThreadPoolExecutor(max_workers=num_workers) as executor:
+        if not as_jsonl:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'predicted_class', 'confidence', f'top_{top_k}', 'error'])
+        
+        def write(record):
+            if as_jsonl:
+                f.write(json.dumps(record) + "\n")
+            else:
+                top = ';'.join(f"{p['class']}:{p['confidence']:.4f}" for p in record.get('top_predictions', []))
+                writer.writerow([record['path'], record.get('predicted_class', ''),
+                                 record.get('confidence', ''), top, record.get('error', '')])
+        
+        def run_batch(loaded, buffer):
+            valid = [row for row, (_, error) in enumerate(loaded) if error is None]
+            for path, error in loaded:
+                if error is not None:
+                    write({"path": path, "error": error})
+            if not valid:
+                return 0
+            
+            predictions = model.predict(buffer.normalize(buffer.compact(valid)))
+            for path, probs in zip([loaded[row][0] for row in valid], predictions):
+                top_idx = np.argsort(probs)[-top_k:][::-1]
+                write({
+                    "path": path,
+                    "predicted_class": class_names[top_idx[0]],
+                    "confidence": float(probs[top_idx[0]]),
+                    "top_predictions": [{"class": class_names[i], "confidence": float(probs[i])} for i in top_idx]
+                })
+            f.flush()
+            return len(valid)
+        
+        # Decode batch n+1 into one buffer while batch n runs from the other
+        buffers = [BatchBuffer(batch_size), BatchBuffer(batch_size)]
+        pending = None
+        for n, start in enumerate(range(0, len(paths), batch_size)):
+            buffer = buffers[n % 2]
+            submitted = ([executor.submit(_decode_for_batch, path, buffer, row)
+                          for row, path in enumerate(paths[start:start + batch_size])], buffer)
+            if pending is not None:
+                scored += run_batch([future.result() for future in pending[0]], pending[1])
+            pending = submitted
+        if pending is not None:
+            scored += run_batch([future.result() for future in pending[0]], pending[1])
+    
+    elapsed = time.time() - start_time
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.1f} images/s)")
+    print(f"Results written to {output_path}")
+    return scored
+
+def create_test_generator(test_data_dir, batch_size=32):
+    """Unshuffled, rescaled generator over a labelled image directory"""
+    test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=RESCALE)
+    return test_datagen.flow_from_directory(
         test_data_dir,
         target_size=(224, 224),
         batch_size=batch_size,
         class_mode='categorical',
         shuffle=False
     )
+
+class StreamingMetrics:
+    """
+    Loss, accuracy and confusion matrix accumulated batch by batch, so no
+    predictions need to be kept around after their batch
+    """
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.loss_sum = 0.0
+        self.count = 0
     
-    # Evaluate model
-    results = model.evaluate(test_generator)
-    print(f"Test loss: {results[0]:.4f}")
-    print(f"Test accuracy: {results[1]:.4f}")
-    
-    # Get predictions
-    predictions = model.predict(test_generator)
-    y_pred = np.argmax(predictions, axis=1)
-    y_true = test_generator.classes
-    
-    # Generate classification report
-    report = classification_report(y_true, y_pred, target_names=class_names)
-    print("Classification Report:")
-    print(report)
+    def update(self, y_true, probabilities):
+        """y_true: one-hot labels or class indices; probabilities: softmax outputs"""
+        y_true = np.asarray(y_true)
+        if y_true.ndim == 2:
+            y_true = np.argmax(y_true, axis=1)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        
+        # Categorical cross-entropy, clipped like Keras
+        true_probs = probabilities[np.arange(len(y_true)), y_true]
+        self.loss_sum += float(-np.sum(np.log(np.clip(true_probs, 1e-7, 1.0))))
+        self.count += len(y_true)
+        
+        y_pred = np.argmax(probabilities, axis=1)
+        np.add.at(self.confusion, (y_true, y_pred), 1)
     
-    # Generate confusion matrix
-    cm = confusion_matrix(y_true, y_pred)
+    def result(self, class_names):
+        cm = self.confusion
+        true_positives = np.diag(cm).astype(np.float64)
+        predicted = cm.sum(axis=0)
+        actual = cm.sum(axis=1)
+        precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+        recall = np.divide(true_positives, actual, out=np.zeros_like(true_positives), where=actual > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(true_positives), where=(precision + recall) > 0)
+        
+        return {
+            "samples": int(self.count),
+            "loss": self.loss_sum / self.count if self.count else 0.0,
+            "accuracy": float(true_positives.sum() / self.count) if self.count else 0.0,
+            "per_class": {
+                name: {
+                    "precision": float(precision[i]),
+                    "recall": float(recall[i]),
+                    "f1": float(f1[i]),
+                    "support": int(actual[i])
+                }
+                for i, name in enumerate(class_names)
+            },
+            "confusion_matrix": cm.tolist()
+        }
+
+def format_report(metrics):
+    """Text classification report (per-class precision/recall/F1) from StreamingMetrics.result()"""
+    width = max(len(name) for name in metrics["per_class"]) + 2
+    lines = [f"{'':<{width}}{'precision':>10}{'recall':>10}{'f1-score':>10}{'support':>10}"]
+    for name, m in metrics["per_class"].items():
+        lines.append(f"{name:<{width}}{m['precision']:>10.2f}{m['recall']:>10.2f}{m['f1']:>10.2f}{m['support']:>10d}")
+    lines.append(f"{'accuracy':<{width}}{'':>20}{metrics['accuracy']:>10.2f}{metrics['samples']:>10d}")
+    return "\n".join(lines)
+
+def plot_confusion_matrix(cm, class_names, output_path):
     plt.figure(figsize=(15, 12))
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=class_names, yticklabels=class_names)
     plt.xlabel('Predicted')
     plt.ylabel('True')
     plt.title('Confusion Matrix')
     plt.tight_layout()
-    plt.savefig('models/confusion_matrix.png')
+    plt.savefig(output_path)
+    plt.close()
+
+def evaluate_models(model_paths, test_data_dir, class_names_path, batch_size=32,
+                    metrics_path='models/evaluation_metrics.json', plot_dir='models'):
+    """
+    Evaluate several model variants (Keras, exported, quantized) in a single
+    pass over the test set: each batch is decoded once and fed to every
+    model, and metrics are accumulated per batch. Results are keyed by
+    file name; metrics_path=None / plot_dir=None skip the JSON / plots.
+    """
+    class_names = load_class_names(class_names_path)
+    models = {os.path.basename(path): load_backend(path) for path in model_paths}
+    metrics = {name: StreamingMetrics(len(class_names)) for name in models}
+    
+    # Create data generator
+    test_generator = create_test_generator(test_data_dir, batch_size)
+    
+    for i in range(len(test_generator)):
+        images, labels = test_generator[i]
+        for name, model in models.items():
+            metrics[name].update(labels, model.predict(images))
+    
+    results = {}
+    for index, (name, accumulator) in enumerate(metrics.items()):
+        results[name] = accumulator.result(class_names)
+        print(f"{name}: test loss {results[name]['loss']:.4f}, test accuracy {results[name]['accuracy']:.4f}")
+        
+        if plot_dir:
+            # The first model keeps the original plot name
+            plot_name = 'confusion_matrix.png' if index == 0 else f'confusion_matrix_{os.path.splitext(name)[0]}.png'
+            plot_confusion_matrix(accumulator.confusion, class_names, os.path.join(plot_dir, plot_name))
+    
+    if metrics_path:
+        with open(metrics_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved metrics to {metrics_path}")
+    
+    return results
+
+def evaluate_model(model_path, test_data_dir, class_names_path, batch_size=32, compare_model_paths=(),
+                   metrics_path='models/evaluation_metrics.json'):
+    """Evaluate model on test dataset (optionally alongside other variants in the same pass)"""
+    results = evaluate_models([model_path] + list(compare_model_paths), test_data_dir, class_names_path,
+                              batch_size=batch_size, metrics_path=metrics_path)
+    metrics = results[os.path.basename(model_path)]
+    
+    print(f"Test loss: {metrics['loss']:.4f}")
+    print(f"Test accuracy: {metrics['accuracy']:.4f}")
+    
+    # Generate classification report
+    report = format_report(metrics)
+    print("Classification Report:")
+    print(report)
     
-    return results, report, cm
\ No newline at end of file
+    cm = np.asarray(metrics['confusion_matrix'])
+    return [metrics['loss'], metrics['accuracy']], report, cm
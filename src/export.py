@@ -0,0 +1,122 @@
+# src/export.py
+import os
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from backends import load_backend, KerasBackend
+from evaluate import create_test_generator
+
+
+@contextmanager
+def exported_saved_model(model):
+    """
+    Export a Keras model to a temporary SavedModel directory. Both
+    converters go through it so the batch dimension stays dynamic.
+    """
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir)
+        yield saved_model_dir
+
+
+def convert_tflite(model, configure=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer. configure(converter) can
+    set optimization options (e.g. quantization) before conversion.
+    """
+    with exported_saved_model(model) as saved_model_dir:
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        if configure is not None:
+            configure(converter)
+        return converter.convert()
+
+
+def export_tflite(model, output_path, configure=None):
+    """Convert a Keras model to TFLite and write it to output_path"""
+    tflite_model = convert_tflite(model, configure)
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"Saved TFLite model to {output_path} ({len(tflite_model) / 1e6:.1f} MB)")
+    return output_path
+
+
+def export_onnx(model, output_path, opset=13):
+    """Convert a Keras model to ONNX (needs the optional tf2onnx package)"""
+    try:
+        import tf2onnx
+    except ImportError:
+        raise ImportError("ONNX export needs tf2onnx: pip install tf2onnx onnxruntime")
+
+    # tf2onnx.convert.from_keras does not support Keras 3 models; convert the
+    # serving function of the exported SavedModel instead
+    input_shape = (None,) + tuple(model.input_shape[1:])
+    input_signature = [tf.TensorSpec(input_shape, tf.float32, name='input')]
+    with exported_saved_model(model) as saved_model_dir:
+        saved_model = tf.saved_model.load(saved_model_dir)
+        tf2onnx.convert.from_function(saved_model.serve, input_signature=input_signature,
+                                      opset=opset, output_path=output_path)
+    print(f"Saved ONNX model to {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+    return output_path
+
+
+def check_parity(reference, candidate, test_data_dir, batch_size=32, max_images=None):
+    """
+    Compare top-1 predictions of two backends on the test split.
+    Returns the fraction of images where both agree.
+    """
+    test_generator = create_test_generator(test_data_dir, batch_size)
+
+    agree = 0
+    total = 0
+    for _ in range(len(test_generator)):
+        images, _ = next(test_generator)
+        if max_images is not None:
+            images = images[:max_images - total]
+        reference_top1 = np.argmax(reference.predict(images), axis=1)
+        candidate_top1 = np.argmax(candidate.predict(images), axis=1)
+        agree += int(np.sum(reference_top1 == candidate_top1))
+        total += len(images)
+        if max_images is not None and total >= max_images:
+            break
+
+    agreement = agree / total if total else 0.0
+    print(f"Top-1 agreement {candidate.name} vs {reference.name}: {agreement:.4f} ({agree}/{total})")
+    if agreement < 0.99:
+        print("Warning: exported model disagrees with Keras on more than 1% of test images")
+    return agreement
+
+
+def export_model(model_path='models/saved_models/crop_disease_model.keras',
+                 output_dir='models/saved_models',
+                 formats=('tflite',),
+                 test_data_dir='data/processed/test',
+                 parity_images=None,
+                 batch_size=32):
+    """
+    Export the trained model for the CPU serving runtimes and check that
+    every export agrees with the Keras model on the test split
+    """
+    model = load_model(model_path)
+    base_name = os.path.splitext(os.path.basename(model_path))[0]
+
+    exported = {}
+    for fmt in formats:
+        output_path = os.path.join(output_dir, f'{base_name}.{fmt}')
+        if fmt == 'tflite':
+            exported[fmt] = export_tflite(model, output_path)
+        elif fmt == 'onnx':
+            exported[fmt] = export_onnx(model, output_path)
+        else:
+            raise ValueError(f"Unknown export format '{fmt}'")
+
+    if test_data_dir and os.path.exists(test_data_dir):
+        reference = KerasBackend(model=model)
+        for fmt, path in exported.items():
+            check_parity(reference, load_backend(path), test_data_dir,
+                         batch_size=batch_size, max_images=parity_images)
+    else:
+        print(f"Skipping parity check: {test_data_dir} not found")
+
+    return exported
@@ -0,0 +1,132 @@
+# src/feature_cache.py
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+def _iter_batches(data, steps):
+    """Yield (images, labels) from a Keras iterator/Sequence or a tf.data dataset"""
+    if hasattr(data, 'take'):
+        for images, labels in data.take(steps):
+            yield images.numpy(), labels.numpy()
+    else:
+        for i in range(steps):
+            yield data[i % len(data)]
+
+def cache_key(feature_extractor, manifest_path='data/processed/manifest.json'):
+    """
+    Fingerprint of what the cached features depend on: the processed
+    dataset (its manifest), the backbone and the precision policy
+    """
+    digest = hashlib.sha256()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps({
+        "backbone": feature_extractor.name,
+        "input_shape": list(feature_extractor.input_shape),
+        "output_shape": list(feature_extractor.output_shape),
+        "parameters": int(feature_extractor.count_params()),
+        "precision": tf.keras.mixed_precision.global_policy().name
+    }).encode())
+    return digest.hexdigest()
+
+def extract_features(feature_extractor, data, num_samples, batch_size, features_path, labels_path):
+    """Run the frozen backbone once over num_samples images and store the pooled features"""
+    steps = (num_samples + batch_size - 1) // batch_size
+    num_features = feature_extractor.output_shape[-1]
+    features = np.lib.format.open_memmap(features_path, mode='w+', dtype=np.float32,
+                                         shape=(steps * batch_size, num_features))
+    labels = np.zeros(steps * batch_size, dtype=np.int32)
+
+    count = 0
+    for images, batch_labels in _iter_batches(data, steps):
+        n = len(images)
+        features[count:count + n] = np.asarray(feature_extractor.predict_on_batch(images))
+        labels[count:count + n] = np.argmax(batch_labels, axis=1)
+        count += n
+    # A repeating dataset can run past the last sample
+    count = min(count, num_samples)
+
+    features.flush()
+    del features
+    np.save(labels_path, labels[:count])
+
+    # Trim to the samples actually written
+    return np.load(features_path, mmap_mode='r')[:count], labels[:count]
+
+def load_or_extract_features(feature_extractor, data, num_samples, batch_size, cache_dir, name, key):
+    """
+    Reuse cached features for name if they were extracted for the same key
+    (see cache_key) and num_samples, otherwise extract and store them
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    features_path = os.path.join(cache_dir, f'{name}_features.npy')
+    labels_path = os.path.join(cache_dir, f'{name}_labels.npy')
+    meta_path = os.path.join(cache_dir, f'{name}_meta.json')
+
+    if all(os.path.exists(path) for path in (features_path, labels_path, meta_path)):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        labels = np.load(labels_path)
+        if meta.get("key") == key and len(labels) == num_samples:
+            features = np.load(features_path, mmap_mode='r')[:len(labels)]
+            print(f"Loaded {len(labels)} cached {name} features from {cache_dir}")
+            return features, labels
+        print(f"Cached {name} features are out of date (dataset, backbone or precision changed), re-extracting")
+
+    start_time = time.time()
+    features, labels = extract_features(feature_extractor, data, num_samples, batch_size,
+                                        features_path, labels_path)
+    with open(meta_path, 'w') as f:
+        json.dump({"key": key, "num_samples": len(labels)}, f)
+    elapsed = time.time() - start_time
+    print(f"Extracted {len(labels)} {name} features in {elapsed:.1f}s ({len(labels) / elapsed:.1f} images/s)")
+    return features, labels
+
+def train_head_on_features(feature_extractor, head_model, train_data, clean_train_data, valid_data,
+                           train_samples, valid_samples, num_classes, batch_size=32, epochs=10,
+                           augmentations=0, cache_dir='data/features',
+                           manifest_path='data/processed/manifest.json'):
+    """
+    Train the classification head on cached backbone features.
+
+    The frozen backbone runs once over the un-augmented training set
+    (clean_train_data), plus `augmentations` passes over the augmented
+    training data, and once over the validation set. The head then trains
+    on the stored 1280-d features, which takes seconds per epoch instead of
+    a full backbone forward pass over every image. Cached features are
+    re-extracted when the processed dataset (manifest_path), the backbone
+    or the precision policy changes.
+    """
+    key = cache_key(feature_extractor, manifest_path)
+    train_parts = [load_or_extract_features(feature_extractor, clean_train_data, train_samples,
+                                            batch_size, cache_dir, 'train', key)]
+    for i in range(augmentations):
+        train_parts.append(load_or_extract_features(feature_extractor, train_data, train_samples,
+                                                    batch_size, cache_dir, f'train_aug{i}', key))
+    valid_features, valid_labels = load_or_extract_features(feature_extractor, valid_data, valid_samples,
+                                                            batch_size, cache_dir, 'val', key)
+
+    # The head trains in memory (1280 floats per image)
+    train_features = np.concatenate([np.asarray(features) for features, _ in train_parts])
+    train_labels = np.concatenate([labels for _, labels in train_parts])
+
+    callbacks = [
+        EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True, verbose=1),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, min_lr=1e-6, verbose=1)
+    ]
+
+    print(f"Training head on {len(train_labels)} cached feature vectors...")
+    return head_model.fit(
+        train_features,
+        tf.keras.utils.to_categorical(train_labels, num_classes),
+        batch_size=batch_size,
+        epochs=epochs,
+        shuffle=True,
+        validation_data=(np.asarray(valid_features), tf.keras.utils.to_categorical(valid_labels, num_classes)),
+        callbacks=callbacks
+    )
@@ -1,41 +1,140 @@
 # src/main.py
 import argparse
 import os
+import yaml
 from utils import download_dataset
 from data_preparation import process_dataset, create_data_generators
-from train import train_model
-from evaluate import evaluate_model, predict_disease
+from train import train_model, train_distributed
+from evaluate import evaluate_model, predict_disease, predict_disease_tiled, predict_images
+from export import export_model
+from quantize import quantize_model
+from backends import PRECISIONS
+
+def load_training_config(config_path='configs/config.yaml'):
+    """training section of the config file (defaults for the train flags)"""
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return (yaml.safe_load(f) or {}).get('training') or {}
 
 def main():
+    training_config = load_training_config()
     parser = argparse.ArgumentParser(description='Crop Disease Detection')
-    parser.add_argument('--mode', type=str, default='train', choices=['download', 'process', 'train', 'evaluate', 'predict'])
+    parser.add_argument('--mode', type=str, default='train', choices=['download', 'process', 'train', 'evaluate', 'predict', 'export', 'quantize'])
     parser.add_argument('--epochs', type=int, default=30)
     parser.add_argument('--batch_size', type=int, default=32)
     parser.add_argument('--fine_tune', action='store_true')
     parser.add_argument('--image_path', type=str, help='Path to image for prediction')
+    parser.add_argument('--inputs', type=str, nargs='+',
+                        help='Directories, glob patterns or .txt file lists to score in bulk (--mode predict)')
+    parser.add_argument('--output', type=str, default='predictions.csv',
+                        help='Bulk prediction output (.csv or .jsonl)')
+    parser.add_argument('--model_path', type=str, default='models/saved_models/crop_disease_model.keras',
+                        help='Model for bulk prediction (.keras, .tflite or .onnx)')
+    parser.add_argument('--num_workers', type=int, default=4, help='Image decode threads for bulk prediction')
+    parser.add_argument('--compare_models', type=str, nargs='*', default=[],
+                        help='Extra model variants (.keras/.tflite/.onnx) to evaluate in the same pass')
+    parser.add_argument('--formats', type=str, nargs='+', default=['tflite'], choices=['tflite', 'onnx'],
+                        help='Export formats for --mode export')
+    parser.add_argument('--parity_images', type=int, default=None,
+                        help='Limit the export parity check to this many test images')
+    parser.add_argument('--pack_shards', action='store_true',
+                        help='Also pack processed images into memory-mapped shards (--mode process)')
+    parser.add_argument('--data_format', type=str, default='directory', choices=['directory', 'shards'],
+                        help='Read training data from JPEG directories or packed shards')
+    parser.add_argument('--input_pipeline', type=str, default='generator', choices=['generator', 'tf_data'],
+                        help='Feed training from ImageDataGenerator or the tf.data pipeline')
+    parser.add_argument('--feature_cache', action='store_true',
+                        help='Train the head on precomputed frozen-backbone features')
+    parser.add_argument('--feature_augmentations', type=int, default=0,
+                        help='Augmented passes over the training set to add to the feature cache')
+    parser.add_argument('--xla', action=argparse.BooleanOptionalAction, default=training_config.get('xla', False),
+                        help='XLA-compile the training steps (default: training.xla in configs/config.yaml)')
+    parser.add_argument('--precision', type=str, default=training_config.get('precision', 'float32'), choices=PRECISIONS,
+                        help='Training precision policy (default: training.precision in configs/config.yaml)')
+    parser.add_argument('--tiled', action='store_true',
+                        help='Predict --image_path from overlapping 224x224 tiles at full resolution')
+    parser.add_argument('--tile_overlap', type=float, default=0.25, help='Overlap between neighbouring tiles (0-1)')
+    parser.add_argument('--tile_aggregate', type=str, default='mean', choices=['mean', 'max'],
+                        help='How tile probabilities combine into the image prediction')
+    parser.add_argument('--max_side', type=int, default=None,
+                        help='Downscale images whose longer side exceeds this before tiling')
+    parser.add_argument('--heatmap', type=str, default=None,
+                        help='Save the tile heatmap of the predicted class to this image (--tiled)')
+    parser.add_argument('--train_workers', type=int, default=training_config.get('workers', 1),
+                        help='Local worker processes for data-parallel training (default: training.workers)')
+    parser.add_argument('--threads_per_worker', type=int, default=training_config.get('threads_per_worker'),
+                        help='Math threads per training worker (default: cores / workers)')
+    parser.add_argument('--calibration_images', type=int, default=200,
+                        help='Validation images used to calibrate int8 quantization')
     args = parser.parse_args()
+    if args.mode == 'train' and args.train_workers > 1:
+        # Distributed training always reads the JPEG directories through tf.data
+        if args.feature_cache:
+            parser.error("--feature_cache is not supported with --train_workers > 1")
+        if args.data_format != 'directory':
+            parser.error(f"--data_format {args.data_format} is not supported with --train_workers > 1")
     
     if args.mode == 'download':
         download_dataset()
     
     elif args.mode == 'process':
-        process_dataset()
+        process_dataset(pack=args.pack_shards)
+    
+    elif args.mode == 'train' and args.train_workers > 1:
+        # --batch_size is per worker; the input is always the sharded tf.data pipeline
+        train_distributed(args.train_workers, threads_per_worker=args.threads_per_worker,
+                          epochs=args.epochs, batch_size=args.batch_size, fine_tune=args.fine_tune,
+                          xla=args.xla, precision=args.precision)
     
     elif args.mode == 'train':
-        train_model(epochs=args.epochs, batch_size=args.batch_size, fine_tune=args.fine_tune)
+        train_model(epochs=args.epochs, batch_size=args.batch_size, fine_tune=args.fine_tune,
+                    data_format=args.data_format, input_pipeline=args.input_pipeline,
+                    feature_cache=args.feature_cache, feature_augmentations=args.feature_augmentations,
+                    xla=args.xla, precision=args.precision)
     
     elif args.mode == 'evaluate':
         evaluate_model(
             model_path='models/saved_models/crop_disease_model.keras',
             test_data_dir='data/processed/test',
             class_names_path='models/saved_models/class_names.txt',
-            batch_size=args.batch_size
+            batch_size=args.batch_size,
+            compare_model_paths=args.compare_models
         )
     
     elif args.mode == 'predict':
-        if args.image_path and os.path.exists(args.image_path):
+        if args.inputs:
+            predict_images(
+                model_path=args.model_path,
+                inputs=args.inputs,
+                class_names_path='models/saved_models/class_names.txt',
+                output_path=args.output,
+                batch_size=args.batch_size,
+                num_workers=args.num_workers
+            )
+        elif args.tiled and args.image_path and os.path.exists(args.image_path):
+            predicted_class, confidence, top_3, result = predict_disease_tiled(
+                model_path=args.model_path,
+                img_path=args.image_path,
+                class_names_path='models/saved_models/class_names.txt',
+                overlap=args.tile_overlap,
+                batch_size=args.batch_size,
+                max_side=args.max_side,
+                aggregate=args.tile_aggregate,
+                heatmap_path=args.heatmap
+            )
+            rows, columns = result["heatmap"].shape[:2]
+            print(f"Tiled {result['image_size'][0]}x{result['image_size'][1]} image into {rows}x{columns} tiles")
+            print(f"Predicted class: {predicted_class}")
+            print(f"Confidence: {confidence:.4f}")
+            print("Top 3 predictions:")
+            for cls, conf in top_3:
+                print(f"  {cls}: {conf:.4f}")
+            if args.heatmap:
+                print(f"Heatmap saved to {args.heatmap}")
+        elif args.image_path and os.path.exists(args.image_path):
             predicted_class, confidence, top_3 = predict_disease(
-                model_path='models/saved_models/crop_disease_model.h5',
+                model_path='models/saved_models/crop_disease_model.keras',
                 img_path=args.image_path,
                 class_names_path='models/saved_models/class_names.txt'
             )
@@ -45,7 +144,28 @@ def main():
             for cls, conf in top_3:
                 print(f"  {cls}: {conf:.4f}")
         else:
-            print("Please provide a valid image path using --image_path")
+            print("Please provide a valid image path using --image_path or images to score using --inputs")
+    
+    elif args.mode == 'export':
+        export_model(
+            model_path='models/saved_models/crop_disease_model.keras',
+            output_dir='models/saved_models',
+            formats=args.formats,
+            test_data_dir='data/processed/test',
+            parity_images=args.parity_images,
+            batch_size=args.batch_size
+        )
+    
+    elif args.mode == 'quantize':
+        quantize_model(
+            model_path='models/saved_models/crop_disease_model.keras',
+            output_dir='models/saved_models',
+            val_data_dir='data/processed/val',
+            test_data_dir='data/processed/test',
+            class_names_path='models/saved_models/class_names.txt',
+            calibration_images=args.calibration_images,
+            batch_size=args.batch_size
+        )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,9 +4,23 @@ from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 
-def create_model(num_classes, input_shape=(224, 224, 3)):
+from backends import resolve_precision
+
+def configure_precision(precision):
+    """
+    Set the Keras global dtype policy used by layers created afterwards
+    (call before create_model). Returns the policy actually in effect.
+    """
+    precision = resolve_precision(precision)
+    tf.keras.mixed_precision.set_global_policy(precision)
+    print(f"Training precision policy: {precision}")
+    return precision
+
+def create_model(num_classes, input_shape=(224, 224, 3), jit_compile=False):
     """
-    Create a model based on MobileNetV2 for crop disease classification
+    Create a model based on MobileNetV2 for crop disease classification.
+    Layers follow the global Keras dtype policy (see configure_precision);
+    jit_compile=True compiles the train/eval steps with XLA.
     """
     # Load pretrained MobileNetV2 model
     base_model = MobileNetV2(
@@ -26,7 +40,8 @@ def create_model(num_classes, input_shape=(224, 224, 3)):
     x = Dropout(0.5)(x)
     x = Dense(256, activation='relu')(x)
     x = Dropout(0.3)(x)
-    predictions = Dense(num_classes, activation='softmax')(x)
+    # Softmax in float32 even under a mixed precision policy
+    predictions = Dense(num_classes, activation='softmax', dtype='float32')(x)
     
     # Create the model
     model = Model(inputs=base_model.input, outputs=predictions)
@@ -35,7 +50,36 @@ def create_model(num_classes, input_shape=(224, 224, 3)):
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
         loss='categorical_crossentropy',
-        metrics=['accuracy']
+        metrics=['accuracy'],
+        jit_compile=jit_compile
     )
     
-    return model, base_model
\ No newline at end of file
+    return model, base_model
+
+def split_backbone_and_head(model, num_features=1280, jit_compile=False):
+    """
+    Split a model from create_model at its pooling layer into a feature
+    extractor (image -> pooled features) and a head model (features ->
+    class probabilities). The head reuses the model's own Dense layers, so
+    training it trains the full model's head.
+    """
+    pool_index = next(i for i, layer in enumerate(model.layers)
+                      if isinstance(layer, GlobalAveragePooling2D))
+    pool_layer = model.layers[pool_index]
+
+    feature_extractor = Model(inputs=model.input, outputs=pool_layer.output)
+
+    features = tf.keras.Input(shape=(num_features,))
+    x = features
+    for layer in model.layers[pool_index + 1:]:
+        x = layer(x)
+    head_model = Model(inputs=features, outputs=x)
+
+    head_model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+        loss='categorical_crossentropy',
+        metrics=['accuracy'],
+        jit_compile=jit_compile
+    )
+
+    return feature_extractor, head_model
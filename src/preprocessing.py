@@ -0,0 +1,216 @@
+# src/preprocessing.py
+"""
+Image preprocessing shared by training, evaluation and serving.
+
+Images are decoded and resized into uint8 HxWx3 pixels, then scaled to
+float32 [0, 1] (the ImageDataGenerator(rescale=1./255) scaling the models
+are trained with) in one vectorized pass. BatchBuffer keeps both arrays
+preallocated so steady-state batches allocate nothing per image.
+
+predict_tiled scores large photos as overlapping model-sized tiles instead
+of squashing the whole frame, cropping tiles from the uint8 image into a
+BatchBuffer one batch at a time.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)
+RESCALE = 1.0 / 255.0
+
+
+def decode_image(source, target_size=IMG_SIZE, out=None, resample=Image.NEAREST):
+    """
+    Decode image bytes or a file path into uint8 HxWx3 pixels, written into
+    out when given. target_size is (height, width) like keras' load_img.
+
+    JPEGs are decoded in draft mode, letting libjpeg downscale by 1/2, 1/4 or
+    1/8 while decoding (never below target_size), before the exact resize.
+    Nearest resampling matches what keras' load_img does.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    size = (target_size[1], target_size[0])
+    with Image.open(source) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != size:
+            img = img.resize(size, resample)
+        pixels = np.asarray(img)
+
+    if out is None:
+        return pixels
+    out[...] = pixels
+    return out
+
+
+def normalize(pixels, out=None):
+    """Scale uint8 pixels to float32 [0, 1] in a single pass, into out when given"""
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    return np.multiply(pixels, RESCALE, out=out, dtype=np.float32)
+
+
+def load_image(source, target_size=IMG_SIZE):
+    """One image as a normalized (1, H, W, 3) float32 batch"""
+    return normalize(decode_image(source, target_size)[np.newaxis])
+
+
+class BatchBuffer:
+    """
+    Preallocated uint8 pixels and float32 model inputs for up to capacity
+    images, reused batch after batch.
+
+    The array returned by normalize() / batch() is overwritten by the next
+    batch, so the caller must be done with it (e.g. predict has returned)
+    first. With pixel_inputs=True, batch() hands out the uint8 pixels for a
+    model that normalizes them itself (e.g. in an inference process).
+    """
+    def __init__(self, capacity, target_size=IMG_SIZE, pixel_inputs=False):
+        self.target_size = tuple(target_size)
+        self.pixel_inputs = pixel_inputs
+        shape = (capacity,) + self.target_size + (3,)
+        self.pixels = np.empty(shape, dtype=np.uint8)
+        self.inputs = None if pixel_inputs else np.empty(shape, dtype=np.float32)
+
+    @property
+    def capacity(self):
+        return len(self.pixels)
+
+    def decode(self, index, source):
+        """Decode one image straight into row index"""
+        decode_image(source, self.target_size, out=self.pixels[index])
+
+    def put(self, index, pixels):
+        self.pixels[index] = pixels
+
+    def compact(self, rows):
+        """Move the given rows (ascending) to the front; returns their count"""
+        for i, row in enumerate(rows):
+            if row != i:
+                self.pixels[i] = self.pixels[row]
+        return len(rows)
+
+    def normalize(self, count):
+        """Normalize the first count rows in place and return them as a batch"""
+        if self.inputs is None:
+            self.inputs = np.empty(self.pixels.shape, dtype=np.float32)
+        return normalize(self.pixels[:count], out=self.inputs[:count])
+
+    def batch(self, count):
+        """The first count rows as model input: uint8 with pixel_inputs, otherwise normalized"""
+        if self.pixel_inputs:
+            return self.pixels[:count]
+        return self.normalize(count)
+
+
+def tile_origins(length, tile, overlap=0.25, min_overhang=0.1):
+    """
+    Start offsets of tiles covering length, neighbours overlapping by at
+    least overlap of a tile. The last tile is aligned to the far edge; it is
+    left out when it would reach less than min_overhang of a stride past the
+    previous tile, so those few edge pixels go unscored rather than adding a
+    near-duplicate tile.
+    """
+    if length <= tile:
+        return [0]
+    stride = max(1, int(round(tile * (1.0 - overlap))))
+    origins = list(range(0, length - tile, stride))
+    if length - tile - origins[-1] >= min_overhang * stride:
+        origins.append(length - tile)
+    return origins
+
+
+def open_for_tiling(source, tile_size=IMG_SIZE, max_side=None):
+    """
+    Decode image bytes or a file path into a uint8 RGB PIL image to cut
+    tiles from. Images with a longer side above max_side are downscaled
+    (JPEGs while decoding, in draft mode); images smaller than a tile are
+    upscaled to one tile.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    try:
+        if max_side and max(img.size) > max_side:
+            scale = max_side / max(img.size)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if img.format == 'JPEG':
+                img.draft('RGB', size)
+            img = _replace(img, img.resize(size, Image.BILINEAR, reducing_gap=2.0))
+        if img.mode != 'RGB':
+            img = _replace(img, img.convert('RGB'))
+
+        tile_height, tile_width = tile_size
+        if img.width < tile_width or img.height < tile_height:
+            scale = max(tile_width / img.width, tile_height / img.height)
+            size = (max(tile_width, round(img.width * scale)), max(tile_height, round(img.height * scale)))
+            img = _replace(img, img.resize(size, Image.BILINEAR))
+        img.load()
+    except Exception:
+        img.close()
+        raise
+    return img
+
+
+def _replace(img, new_img):
+    """Close img (and the file Image.open holds for it) in favour of new_img"""
+    img.close()
+    return new_img
+
+
+def predict_tiled(predict_fn, source, tile_size=IMG_SIZE, overlap=0.25, batch_size=32, max_side=None,
+                  aggregate='mean', buffer=None, pixel_inputs=False):
+    """
+    Predict a large image from overlapping tile_size tiles at full
+    resolution, so small lesions are not lost to downscaling.
+
+    Tiles are cropped from the uint8 image into a BatchBuffer and passed to
+    predict_fn (batch -> probabilities) batch_size at a time, so besides
+    the decoded image only one batch of tiles is held as float32.
+    aggregate='mean' averages the tile probabilities into the image-level
+    prediction; 'max' takes each class' highest tile probability
+    (renormalized), which favours diseases visible in only a few tiles.
+
+    Returns a dict with the image-level "probabilities", the "heatmap" of
+    tile probabilities (rows x columns x classes), the tile "origins"
+    ((y offsets, x offsets) of the rows and columns) and the tiled
+    "image_size" (width, height).
+    """
+    if aggregate not in ('mean', 'max'):
+        raise ValueError(f"Unknown tile aggregation '{aggregate}', expected 'mean' or 'max'")
+    tile_height, tile_width = tile_size
+    if buffer is None:
+        buffer = BatchBuffer(batch_size, tile_size, pixel_inputs=pixel_inputs)
+
+    with open_for_tiling(source, tile_size, max_side) as img:
+        ys = tile_origins(img.height, tile_height, overlap)
+        xs = tile_origins(img.width, tile_width, overlap)
+        boxes = [(x, y, x + tile_width, y + tile_height) for y in ys for x in xs]
+        image_size = img.size
+
+        heatmap = None
+        for start in range(0, len(boxes), buffer.capacity):
+            chunk = boxes[start:start + buffer.capacity]
+            for row, box in enumerate(chunk):
+                buffer.put(row, np.asarray(img.crop(box)))
+            probabilities = np.asarray(predict_fn(buffer.batch(len(chunk))))
+            if heatmap is None:
+                heatmap = np.empty((len(ys), len(xs), probabilities.shape[-1]), dtype=np.float32)
+            heatmap.reshape(-1, heatmap.shape[-1])[start:start + len(chunk)] = probabilities
+
+    tiles = heatmap.reshape(-1, heatmap.shape[-1])
+    if aggregate == 'max':
+        probabilities = tiles.max(axis=0)
+        probabilities /= probabilities.sum()
+    else:
+        probabilities = tiles.mean(axis=0)
+    return {
+        "probabilities": probabilities,
+        "heatmap": heatmap,
+        "origins": (ys, xs),
+        "image_size": image_size
+    }
@@ -0,0 +1,136 @@
+# src/quantize.py
+import os
+import json
+import glob
+import random
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from backends import KerasBackend, TFLiteBackend
+from evaluate import load_and_preprocess_image, evaluate_models
+from export import export_tflite
+
+
+def representative_images(val_data_dir='data/processed/val', num_images=200, seed=42):
+    """Random sample of validation images (preprocessed like training) for calibration"""
+    paths = [path for path in glob.glob(os.path.join(val_data_dir, '*', '*'))
+             if path.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    random.Random(seed).shuffle(paths)
+    paths = paths[:num_images]
+    print(f"Calibrating on {len(paths)} images from {val_data_dir}")
+
+    def generator():
+        for path in paths:
+            yield [load_and_preprocess_image(path).astype(np.float32)]
+
+    return generator
+
+
+def dynamic_range(converter):
+    """Int8 weights, float activations; needs no calibration data"""
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+
+def full_int8(representative_dataset):
+    """Int8 weights, activations and input/output, calibrated on representative_dataset"""
+    def configure(converter):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return configure
+
+
+def measure_latency(backend, batch_size, runs):
+    """Median and p95 wall time (ms) of one predict call on a random batch"""
+    batch = np.random.rand(batch_size, 224, 224, 3).astype(np.float32)
+    for _ in range(3):  # Warm up
+        backend.predict(batch)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "batch_size": batch_size,
+        "median_ms": float(np.median(timings)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "images_per_second": batch_size * 1000 / float(np.median(timings))
+    }
+
+
+def quantize_model(model_path='models/saved_models/crop_disease_model.keras',
+                   output_dir='models/saved_models',
+                   val_data_dir='data/processed/val',
+                   test_data_dir='data/processed/test',
+                   class_names_path='models/saved_models/class_names.txt',
+                   calibration_images=200,
+                   batch_size=32,
+                   latency_runs=50,
+                   report_path='models/quantization_report.json'):
+    """
+    Produce dynamic-range and full-int8 TFLite variants of the model and
+    compare size, latency and per-class accuracy against the float model
+    """
+    model = load_model(model_path)
+    base_name = os.path.splitext(os.path.basename(model_path))[0]
+
+    # Build the quantized variants
+    variants = {"keras_float32": (model_path, KerasBackend(model=model))}
+    for name, configure in [
+        ('tflite_float32', None),
+        ('tflite_dynamic_range', dynamic_range),
+        ('tflite_int8', full_int8(representative_images(val_data_dir, calibration_images)))
+    ]:
+        output_path = os.path.join(output_dir, f'{base_name}_{name[len("tflite_"):]}.tflite')
+        export_tflite(model, output_path, configure)
+        variants[name] = (output_path, TFLiteBackend(output_path))
+
+    # Accuracy of all variants in one pass over the test set, with the same
+    # metrics evaluate_model reports
+    print("Evaluating all variants on the test set...")
+    metrics = evaluate_models([path for path, _ in variants.values()], test_data_dir, class_names_path,
+                              batch_size=batch_size, metrics_path=None, plot_dir=None)
+
+    # Measure every variant the same way
+    report = {}
+    for name, (path, backend) in variants.items():
+        print(f"Measuring {name}...")
+        result = metrics[os.path.basename(path)]
+        report[name] = {
+            "path": path,
+            "size_mb": os.path.getsize(path) / 1e6,
+            "single_image_latency": measure_latency(backend, 1, latency_runs),
+            "batch_latency": measure_latency(backend, batch_size, max(latency_runs // 5, 3)),
+            "loss": result["loss"],
+            "accuracy": result["accuracy"],
+            "per_class_accuracy": {cls: m["recall"] for cls, m in result["per_class"].items()}
+        }
+
+    # Summary table
+    print(f"{'Variant':<22}{'Size MB':>9}{'1-img ms':>10}{'Batch img/s':>13}{'Accuracy':>10}")
+    for name, result in report.items():
+        print(f"{name:<22}{result['size_mb']:>9.2f}"
+              f"{result['single_image_latency']['median_ms']:>10.2f}"
+              f"{result['batch_latency']['images_per_second']:>13.1f}"
+              f"{result['accuracy']:>10.4f}")
+
+    # Classes where a variant loses more than 1% accuracy against the float model
+    baseline = report['keras_float32']['per_class_accuracy']
+    for name, result in report.items():
+        drops = {cls: baseline[cls] - acc for cls, acc in result['per_class_accuracy'].items()
+                 if baseline[cls] - acc > 0.01}
+        if drops:
+            print(f"{name}: accuracy drops on {len(drops)} classes, worst "
+                  f"{max(drops, key=drops.get)} ({max(drops.values()):.4f})")
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved quantization report to {report_path}")
+
+    return report
@@ -1,43 +1,91 @@
 # src/train.py
 import os
+import shutil
+import tempfile
+import contextlib
 import tensorflow as tf
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau, TensorBoard
 import matplotlib.pyplot as plt
 import time
 from datetime import datetime
 
-from data_preparation import process_dataset, create_data_generators
-from model import create_model
+from data_preparation import (process_dataset, pack_shards, create_data_generators, create_tf_datasets,
+                              create_unaugmented_generator)
+from model import configure_precision, create_model, split_backbone_and_head
+from feature_cache import train_head_on_features
+from distributed import launch_workers, worker_info, is_chief, save_model, worker_output_path
 
-def train_model(epochs=30, batch_size=32, fine_tune=True):
+def train_model(epochs=30, batch_size=32, fine_tune=True, data_format='directory', input_pipeline='generator',
+                feature_cache=False, feature_augmentations=0, xla=False, precision='float32', strategy=None):
     """
-    Train the crop disease detection model
+    Train the crop disease detection model.
+    input_pipeline='tf_data' feeds model.fit from create_tf_datasets instead
+    of the ImageDataGenerator generators. feature_cache=True trains the head
+    of the transfer learning phase on precomputed backbone features.
+    xla=True compiles the training steps with XLA; precision selects a
+    mixed precision policy ('mixed_bfloat16' falls back to float32 on CPUs
+    without native bfloat16).
+    With a distribution strategy (see train_distributed) batch_size is the
+    batch per replica, each worker reads its own shard of the tf.data
+    input and only the chief writes the checkpoint and final model.
     """
+    if feature_cache and input_pipeline == 'tf_data':
+        raise ValueError("feature_cache needs the generator input pipeline")
+    if strategy is not None and (input_pipeline != 'tf_data' or feature_cache):
+        raise ValueError("Distributed training needs the tf_data input pipeline without feature_cache")
+    num_workers, worker_index = worker_info(strategy)
+    chief = is_chief(strategy)
+    scope = strategy.scope() if strategy is not None else contextlib.nullcontext()
+    
+    # Global batch: every replica takes batch_size images per step
+    global_batch_size = batch_size * (strategy.num_replicas_in_sync if strategy is not None else 1)
+    
     # Process dataset if not already done
     if not os.path.exists('data/processed/train'):
         print("Processing dataset...")
         process_dataset()
     
+    # Pack shards if training from them and they do not exist yet
+    if data_format == 'shards' and not os.path.exists('data/processed/shards/index.json'):
+        print("Packing dataset into shards...")
+        pack_shards()
+    
     # Create data generators
-    train_generator, valid_generator, test_generator = create_data_generators(batch_size)
+    if input_pipeline == 'tf_data':
+        train_generator, valid_generator, test_generator, dataset_info = create_tf_datasets(
+            global_batch_size, num_shards=num_workers, shard_index=worker_index)
+        class_names = dataset_info['class_names']
+        train_samples = dataset_info['train_samples']
+        valid_samples = dataset_info['valid_samples']
+    else:
+        train_generator, valid_generator, test_generator = create_data_generators(batch_size, data_format=data_format)
+        class_names = list(train_generator.class_indices.keys())
+        train_samples = train_generator.samples
+        valid_samples = valid_generator.samples
     
     # Get number of classes
-    num_classes = len(train_generator.class_indices)
-    class_names = list(train_generator.class_indices.keys())
+    num_classes = len(class_names)
     
-    print(f"Number of classes: {num_classes}")
-    print(f"Class names: {class_names}")
+    if chief:
+        print(f"Number of classes: {num_classes}")
+        print(f"Class names: {class_names}")
     
-    # Create model
-    model, base_model = create_model(num_classes)
+    # Create model (layers pick up the precision policy; variables are mirrored under a strategy)
+    configure_precision(precision)
+    with scope:
+        model, base_model = create_model(num_classes, jit_compile=xla)
     
     # Create checkpoint directory
     checkpoint_dir = 'models/checkpoints'
     os.makedirs(checkpoint_dir, exist_ok=True)
     
+    # Only the chief writes the real checkpoint and logs; the other workers
+    # still run the callbacks, but into a temporary directory
+    scratch_dir = None if chief else tempfile.mkdtemp(prefix=f'worker_{worker_index}_')
+    
     # Setup callbacks
     checkpoint = ModelCheckpoint(
-        f'{checkpoint_dir}/model_best.keras',  # Changed extension to .keras
+        worker_output_path(f'{checkpoint_dir}/model_best.keras', strategy, scratch_dir),  # Changed extension to .keras
         monitor='val_accuracy',
         save_best_only=True,
         mode='max',
@@ -59,19 +107,38 @@ def train_model(epochs=30, batch_size=32, fine_tune=True):
         verbose=1
     )
     
-    log_dir = "logs/fit/" + datetime.now().strftime("%Y%m%d-%H%M%S")
+    log_dir = worker_output_path("logs/fit/" + datetime.now().strftime("%Y%m%d-%H%M%S"), strategy, scratch_dir)
     tensorboard = TensorBoard(log_dir=log_dir, histogram_freq=1)
     
     # Train the model (transfer learning)
     print("Starting transfer learning phase...")
-    history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // batch_size,
-        validation_data=valid_generator,
-        validation_steps=valid_generator.samples // batch_size,
-        epochs=10,
-        callbacks=[checkpoint, early_stopping, reduce_lr, tensorboard]
-    )
+    if feature_cache:
+        # The base is frozen, so run it once and train the head on its features
+        feature_extractor, head_model = split_backbone_and_head(model, jit_compile=xla)
+        history = train_head_on_features(
+            feature_extractor,
+            head_model,
+            train_data=train_generator,
+            clean_train_data=create_unaugmented_generator('train', batch_size, data_format),
+            valid_data=valid_generator,
+            train_samples=train_samples,
+            valid_samples=valid_samples,
+            num_classes=num_classes,
+            batch_size=batch_size,
+            epochs=10,
+            augmentations=feature_augmentations
+        )
+        # The head layers are shared, so the full model now carries the trained head
+        model.save(f'{checkpoint_dir}/model_best.keras')
+    else:
+        history = model.fit(
+            train_generator,
+            steps_per_epoch=train_samples // global_batch_size,
+            validation_data=valid_generator,
+            validation_steps=valid_samples // global_batch_size,
+            epochs=10,
+            callbacks=[checkpoint, early_stopping, reduce_lr, tensorboard]
+        )
     
     # Fine-tuning (optional)
     if fine_tune:
@@ -81,18 +148,20 @@ def train_model(epochs=30, batch_size=32, fine_tune=True):
             layer.trainable = True
             
         # Recompile the model with a lower learning rate
-        model.compile(
-            optimizer=tf.keras.optimizers.Adam(learning_rate=1e-5),
-            loss='categorical_crossentropy',
-            metrics=['accuracy']
-        )
+        with scope:
+            model.compile(
+                optimizer=tf.keras.optimizers.Adam(learning_rate=1e-5),
+                loss='categorical_crossentropy',
+                metrics=['accuracy'],
+                jit_compile=xla
+            )
         
         # Continue training
         fine_tune_history = model.fit(
             train_generator,
-            steps_per_epoch=train_generator.samples // batch_size,
+            steps_per_epoch=train_samples // global_batch_size,
             validation_data=valid_generator,
-            validation_steps=valid_generator.samples // batch_size,
+            validation_steps=valid_samples // global_batch_size,
             epochs=epochs,
             initial_epoch=history.epoch[-1],
             callbacks=[checkpoint, early_stopping, reduce_lr, tensorboard]
@@ -102,8 +171,18 @@ def train_model(epochs=30, batch_size=32, fine_tune=True):
         for k in fine_tune_history.history:
             history.history[k].extend(fine_tune_history.history[k])
     
-    # Save the final model
-    model.save('models/saved_models/crop_disease_model.keras')
+    if scratch_dir is not None:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    
+    # Save the final model (every worker takes part, only the chief writes it)
+    save_model(model, 'models/saved_models/crop_disease_model.keras', strategy)
+    
+    # Evaluate on test set (a collective operation under a strategy)
+    test_results = model.evaluate(test_generator)
+    if not chief:
+        return model, history
+    print(f"Test loss: {test_results[0]:.4f}")
+    print(f"Test accuracy: {test_results[1]:.4f}")
     
     # Save class names
     with open('models/saved_models/class_names.txt', 'w') as f:
@@ -132,12 +211,32 @@ def train_model(epochs=30, batch_size=32, fine_tune=True):
     plt.tight_layout()
     plt.savefig('models/training_history.png')
     
-    # Evaluate on test set
-    test_results = model.evaluate(test_generator)
-    print(f"Test loss: {test_results[0]:.4f}")
-    print(f"Test accuracy: {test_results[1]:.4f}")
-    
     return model, history
 
+def train_distributed(num_workers, threads_per_worker=None, **kwargs):
+    """
+    Data-parallel train_model across num_workers local processes with
+    MultiWorkerMirroredStrategy. Takes the train_model arguments and always
+    uses the tf_data pipeline over the directory dataset (no shards or
+    feature_cache); the global batch is batch_size * num_workers,
+    so scale the epochs or the learning rate accordingly. Writes the same
+    checkpoint (models/checkpoints/model_best.keras) and final model as
+    train_model.
+    """
+    if kwargs.get('feature_cache') or kwargs.get('data_format', 'directory') != 'directory':
+        raise ValueError("Distributed training reads the directory dataset without feature_cache")
+    
+    # Prepare everything the workers would otherwise race to create
+    if not os.path.exists('data/processed/train'):
+        print("Processing dataset...")
+        process_dataset()
+    os.makedirs('models/checkpoints', exist_ok=True)
+    os.makedirs('models/saved_models', exist_ok=True)
+    tf.keras.applications.MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+    tf.keras.backend.clear_session()
+    
+    kwargs['input_pipeline'] = 'tf_data'
+    launch_workers(train_model, num_workers, threads_per_worker=threads_per_worker, **kwargs)
+
 if __name__ == "__main__":
     train_model()
\ No newline at end of file